@@ -1,6 +1,14 @@
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class ChatbotAppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'chatbot_app'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+
+        if settings.MODEL_PRELOAD:
+            from .inference import preload_models
+            preload_models()
@@ -0,0 +1,288 @@
+# chatbot_app/catalog.py
+#
+# Read-only snapshot of the recipe catalog for serving recommendations
+# without the ORM. The file is built by `manage.py build_recipe_catalog`
+# and mapped with mmap, so all workers share the same pages.
+#
+# Layout (little endian, every section 8-byte aligned):
+#
+#   header         magic, version, the counts below and the change feed
+#                  sequence number the snapshot is current up to
+#   ids            int64   * n_recipes
+#   title          uint32  * n_recipes    string id
+#   ingredients    uint32  * n_recipes    string id of the raw ingredients text
+#   instructions   uint32  * n_recipes    string id
+#   taste          uint32  * n_recipes    string id or NONE
+#   cuisine_type   uint32  * n_recipes    string id or NONE
+#   prep_time      int32   * n_recipes
+#   reviews        int32   * n_recipes
+#   ref_offsets    uint32  * (n_recipes + 1)   slice of refs for each recipe
+#   refs           uint32  * n_refs       normalized ingredient names (string ids)
+#   taste_codes    uint32  * n_tastes     distinct tastes (string id or NONE)
+#   taste_starts   uint32  * (n_tastes + 1)    recipes are grouped by taste
+#   vocab          uint32  * n_vocab      ingredient string ids, sorted by text
+#   str_offsets    uint32  * (n_strings + 1)   slice of blob for each string
+#   blob           utf-8 text of all strings
+#
+# Tastes, cuisine types and ingredient names are interned: each distinct
+# value is stored once and referenced by its string id.
+
+from django.conf import settings
+from array import array
+from bisect import bisect_left
+import mmap
+import os
+import struct
+import threading
+import time
+import logging
+
+from .models import Recipe, ChangeLogEntry, normalize_ingredients
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'MKBC'
+VERSION = 2
+NONE = 0xFFFFFFFF
+
+_HEADER = struct.Struct('<4sIIIIIIIQ')
+
+
+def _align(offset):
+    return (offset + 7) & ~7
+
+
+class RecipeCatalog:
+    """
+    A recipe catalog snapshot mapped from disk.
+    """
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            stat = os.fstat(f.fileno())
+            self.version_key = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        buf = memoryview(self._mmap)
+        magic, version, n_recipes, n_refs, n_tastes, n_vocab, n_strings, blob_len, seq = _HEADER.unpack_from(buf, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} recipe catalog.")
+        self.n_recipes = n_recipes
+        self.seq = seq
+
+        offset = _align(_HEADER.size)
+
+        def section(fmt, count):
+            nonlocal offset
+            size = struct.calcsize(fmt) * count
+            view = buf[offset:offset + size].cast(fmt)
+            offset = _align(offset + size)
+            return view
+
+        self.ids = section('q', n_recipes)
+        self.title = section('I', n_recipes)
+        self.ingredients = section('I', n_recipes)
+        self.instructions = section('I', n_recipes)
+        self.taste = section('I', n_recipes)
+        self.cuisine_type = section('I', n_recipes)
+        self.prep_time = section('i', n_recipes)
+        self.reviews = section('i', n_recipes)
+        self.ref_offsets = section('I', n_recipes + 1)
+        self.refs = section('I', n_refs)
+        self.taste_codes = section('I', n_tastes)
+        self.taste_starts = section('I', n_tastes + 1)
+        self.vocab = section('I', n_vocab)
+        self.str_offsets = section('I', n_strings + 1)
+        self.blob = buf[offset:offset + blob_len]
+
+    def string(self, string_id):
+        if string_id == NONE:
+            return None
+        return str(self.blob[self.str_offsets[string_id]:self.str_offsets[string_id + 1]], 'utf-8')
+
+    def _string_bytes(self, string_id):
+        return self.blob[self.str_offsets[string_id]:self.str_offsets[string_id + 1]].tobytes()
+
+    def ingredient_id(self, name):
+        """
+        Returns the string id of a normalized ingredient name, or None if no recipe uses it.
+        """
+        key = name.encode('utf-8')
+        index = bisect_left(self.vocab, key, key=self._string_bytes)
+        if index < len(self.vocab) and self._string_bytes(self.vocab[index]) == key:
+            return self.vocab[index]
+        return None
+
+    def recommend(self, preference, available_ingredients):
+        """
+        Yields the recipes whose taste contains the preference and whose ingredients
+        are all available, serialized like ChatbotService.serialize_recipe.
+        """
+        preference = preference.lower()
+        available = set()
+        for ing in available_ingredients:
+            string_id = self.ingredient_id(ing.lower())
+            if string_id is not None:
+                available.add(string_id)
+
+        refs, ref_offsets = self.refs, self.ref_offsets
+        for group, code in enumerate(self.taste_codes):
+            if code == NONE or preference not in self.string(code).lower():
+                continue
+            for index in range(self.taste_starts[group], self.taste_starts[group + 1]):
+                if all(ref in available for ref in refs[ref_offsets[index]:ref_offsets[index + 1]]):
+                    yield self.serialize(index)
+
+    def serialize(self, index):
+        return {
+            'title': self.string(self.title[index]),
+            'ingredients': self.string(self.ingredients[index]).split(','),
+            'instructions': self.string(self.instructions[index]),
+            'taste': self.string(self.taste[index]),
+            'cuisine_type': self.string(self.cuisine_type[index]),
+            'preparation_time': self.prep_time[index]
+        }
+
+
+def write_catalog(path, rows, seq=0):
+    """
+    Writes a catalog snapshot from rows of
+    (id, title, ingredients, instructions, taste, cuisine_type, preparation_time, reviews).
+    `seq` is the last change feed entry the rows include.
+
+    Rows must arrive grouped by taste. The file is written next to `path` and
+    renamed over it, so readers see either the old or the new snapshot.
+    Returns the number of recipes written.
+    """
+    strings = {}
+    blob = bytearray()
+    str_offsets = array('I', [0])
+
+    def intern(value):
+        if value is None:
+            return NONE
+        string_id = strings.get(value)
+        if string_id is None:
+            string_id = strings[value] = len(str_offsets) - 1
+            blob.extend(value.encode('utf-8'))
+            str_offsets.append(len(blob))
+        return string_id
+
+    def append(value):
+        # Titles and instructions are rarely shared, so they are not interned.
+        blob.extend(value.encode('utf-8'))
+        str_offsets.append(len(blob))
+        return len(str_offsets) - 2
+
+    ids = array('q')
+    title, ingredients, instructions = array('I'), array('I'), array('I')
+    taste, cuisine_type = array('I'), array('I')
+    prep_time, reviews = array('i'), array('i')
+    ref_offsets, refs = array('I', [0]), array('I')
+    taste_codes, taste_starts = array('I'), array('I')
+    vocab = set()
+
+    for recipe_id, r_title, r_ingredients, r_instructions, r_taste, r_cuisine, r_prep, r_reviews in rows:
+        index = len(ids)
+        taste_id = intern(r_taste)
+        if not taste_codes or taste_codes[-1] != taste_id:
+            if taste_id in taste_codes:
+                raise ValueError("Catalog rows must be grouped by taste.")
+            taste_codes.append(taste_id)
+            taste_starts.append(index)
+
+        ids.append(recipe_id)
+        title.append(append(r_title))
+        ingredients.append(intern(r_ingredients))
+        instructions.append(append(r_instructions))
+        taste.append(taste_id)
+        cuisine_type.append(intern(r_cuisine))
+        prep_time.append(r_prep)
+        reviews.append(r_reviews)
+
+        for name in normalize_ingredients(r_ingredients):
+            string_id = intern(name)
+            vocab.add(string_id)
+            refs.append(string_id)
+        ref_offsets.append(len(refs))
+
+    taste_starts.append(len(ids))
+    vocab = array('I', sorted(vocab, key=lambda string_id: blob[str_offsets[string_id]:str_offsets[string_id + 1]]))
+
+    sections = [
+        ids, title, ingredients, instructions, taste, cuisine_type, prep_time, reviews,
+        ref_offsets, refs, taste_codes, taste_starts, vocab, str_offsets,
+    ]
+    header = _HEADER.pack(
+        MAGIC, VERSION, len(ids), len(refs), len(taste_codes), len(vocab), len(str_offsets) - 1, len(blob), seq
+    )
+
+    tmp_path = f"{path}.tmp{os.getpid()}"
+    with open(tmp_path, 'wb') as f:
+        f.write(header)
+        for data in sections + [blob]:
+            f.write(b'\0' * (_align(f.tell()) - f.tell()))
+            f.write(data if isinstance(data, bytearray) else data.tobytes())
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+    return len(ids)
+
+
+def recipes_changed_since(seq):
+    """
+    Whether the change feed has recipe changes after `seq`.
+    """
+    return ChangeLogEntry.objects.filter(model=Recipe._meta.model_name, id__gt=seq).exists()
+
+
+_catalog = None
+_stale = False
+_checked_at = 0.0
+_lock = threading.Lock()
+
+
+def get_catalog():
+    """
+    Returns the current catalog snapshot, or None when there is no snapshot
+    file or the snapshot is stale.
+
+    The file is re-checked at most every RECIPE_CATALOG_CHECK_INTERVAL seconds;
+    when it has been replaced the new snapshot is loaded and swapped in.
+    Readers holding the old one keep using it until they are done. A snapshot
+    is stale when the change feed has recipe changes after the one it was
+    built at; callers then use the database until it is rebuilt (see
+    `build_recipe_catalog --if-changed` and gunicorn.conf.py).
+    """
+    global _catalog, _stale, _checked_at
+
+    now = time.monotonic()
+    if now - _checked_at < settings.RECIPE_CATALOG_CHECK_INTERVAL:
+        return None if _stale else _catalog
+
+    with _lock:
+        if now - _checked_at < settings.RECIPE_CATALOG_CHECK_INTERVAL:
+            return None if _stale else _catalog
+        _checked_at = now
+
+        path = settings.RECIPE_CATALOG_PATH
+        try:
+            stat = os.stat(path)
+        except OSError:
+            _catalog = None
+            return None
+
+        version_key = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        if _catalog is None or _catalog.version_key != version_key:
+            try:
+                _catalog = RecipeCatalog(path)
+                logger.info(f"Loaded recipe catalog {path} ({_catalog.n_recipes} recipes) in pid {os.getpid()}")
+            except (OSError, ValueError) as e:
+                logger.error(f"Could not load recipe catalog {path}: {e}")
+
+        _stale = _catalog is not None and recipes_changed_since(_catalog.seq)
+        if _stale:
+            logger.info(f"Recipe catalog {path} is behind the change feed; using the database.")
+
+    return None if _stale else _catalog
@@ -0,0 +1,155 @@
+# chatbot_app/changefeed.py
+#
+# Change feed over Recipe and Ingredient. Every save and delete appends a
+# ChangeLogEntry (see signals.py); derived structures such as search or
+# recommendation indexes and caches keep a named checkpoint and apply only
+# the changes made since, instead of rescanning the tables.
+#
+#   consumer = ChangeFeedConsumer('search-index', models=['recipe'])
+#   consumer.consume(apply_changes)   # apply_changes(list of Change)
+#
+# Bulk writes (bulk_create, bulk_update, QuerySet.update) don't send signals;
+# code using them must call record_changes() itself.
+#
+# The entry id is the sequence number. Ids are handed out when a row is
+# inserted, not when its transaction commits, so with concurrent writers
+# (PostgreSQL, MySQL) an entry can become visible after entries with higher
+# ids. SQLite serializes writers, so there it can't, but readers here don't
+# rely on that: they only advance to the end of the contiguous run of ids
+# (see visible_seq()). A missing id is waited for until the entry after it
+# is CHANGEFEED_SETTLE_SECONDS old; after that it is taken to be from a
+# rolled-back transaction. Transactions writing the feed must therefore be
+# shorter than that.
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Min
+from django.utils import timezone
+from collections import namedtuple
+from datetime import timedelta
+import logging
+
+from .models import ChangeLogEntry, ChangeFeedCheckpoint
+
+logger = logging.getLogger(__name__)
+
+Change = namedtuple('Change', ['seq', 'model', 'object_id', 'operation'])
+
+
+def model_label(model):
+    return model._meta.model_name
+
+
+def record_change(model, object_id, operation):
+    ChangeLogEntry.objects.create(model=model_label(model), object_id=object_id, operation=operation)
+
+
+def record_changes(model, object_ids, operation, batch_size=1000):
+    """
+    Records one change per object id, for writes that bypass model signals.
+    """
+    label = model_label(model)
+    ChangeLogEntry.objects.bulk_create(
+        [ChangeLogEntry(model=label, object_id=object_id, operation=operation) for object_id in object_ids],
+        batch_size=batch_size
+    )
+
+
+def visible_seq(after=0, limit=None):
+    """
+    Returns the highest sequence number up to which the feed after `after` is
+    complete, i.e. no entry at or below it can still be committed later.
+
+    Scans at most `limit` entries. A gap in the ids stops the scan unless the
+    entry after the gap is older than CHANGEFEED_SETTLE_SECONDS.
+    """
+    settled = timezone.now() - timedelta(seconds=settings.CHANGEFEED_SETTLE_SECONDS)
+    entries = ChangeLogEntry.objects.filter(id__gt=after).order_by('id').values_list('id', 'created_at')
+    if limit is not None:
+        entries = entries[:limit]
+
+    seq = after
+    for entry_id, created_at in entries.iterator(chunk_size=2000):
+        if entry_id != seq + 1 and created_at > settled:
+            break
+        seq = entry_id
+    return seq
+
+
+class ChangeFeedConsumer:
+    """
+    Reads the change feed from a named checkpoint, optionally limited to some models.
+    """
+    def __init__(self, name, models=None):
+        self.name = name
+        self.models = [m if isinstance(m, str) else model_label(m) for m in models] if models else None
+
+    def checkpoint(self):
+        """
+        Returns the last applied sequence number, or None if this consumer never committed.
+        """
+        return ChangeFeedCheckpoint.objects.filter(consumer=self.name).values_list('last_seq', flat=True).first()
+
+    def _entries(self, after):
+        entries = ChangeLogEntry.objects.filter(id__gt=after)
+        if self.models:
+            entries = entries.filter(model__in=self.models)
+        return entries
+
+    def has_changes(self):
+        return self._entries(self.checkpoint() or 0).exists()
+
+    def changes(self, limit=1000):
+        """
+        Returns (changes, last_seq) for up to `limit` log entries after the checkpoint.
+
+        Only entries up to visible_seq() are returned, so an entry committed
+        late is never skipped. Entries for the same object are collapsed into
+        its latest operation, so an object saved many times is applied once.
+        last_seq is what to pass to commit() once the changes have been applied.
+        """
+        after = self.checkpoint() or 0
+        last_seq = visible_seq(after, limit)
+        entries = (
+            self._entries(after).filter(id__lte=last_seq)
+            .order_by('id').values_list('id', 'model', 'object_id', 'operation')
+        )
+
+        latest = {}
+        for seq, model, object_id, operation in entries:
+            latest[(model, object_id)] = Change(seq, model, object_id, operation)
+
+        return sorted(latest.values()), last_seq
+
+    def commit(self, last_seq):
+        ChangeFeedCheckpoint.objects.update_or_create(consumer=self.name, defaults={'last_seq': last_seq})
+
+    def consume(self, handler, limit=1000):
+        """
+        Passes pending changes to `handler` in batches and advances the checkpoint
+        after each batch it handles without raising. Returns the number of changes applied.
+        """
+        applied = 0
+        after = self.checkpoint() or 0
+        while True:
+            changes, last_seq = self.changes(limit)
+            if last_seq == after:
+                return applied
+            if changes:
+                handler(changes)
+            self.commit(last_seq)
+            after = last_seq
+            applied += len(changes)
+            logger.debug(f"Consumer '{self.name}' applied {len(changes)} changes up to #{last_seq}")
+
+
+def prune_changelog():
+    """
+    Deletes the log entries every consumer has already applied. Returns the number deleted.
+    """
+    with transaction.atomic():
+        oldest = ChangeFeedCheckpoint.objects.aggregate(seq=Min('last_seq'))['seq']
+        if oldest is None:
+            return 0
+        deleted, _ = ChangeLogEntry.objects.filter(id__lte=oldest).delete()
+    return deleted
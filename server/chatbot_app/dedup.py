@@ -0,0 +1,200 @@
+# chatbot_app/dedup.py
+#
+# Near-duplicate detection for recipe ingestion. Each recipe gets a MinHash
+# signature over character shingles of its normalized ingredients and
+# instructions (character shingles tolerate OCR typos). The signature is cut
+# into LSH bands; recipes sharing any band bucket are candidates, and only
+# those are compared, so a lookup doesn't depend on the catalog size.
+# Recipes with too little text to tell apart get no signature, and a
+# candidate must also have a similar title to count as a duplicate.
+
+from django.db import transaction
+from django.db.models import Q
+from array import array
+from hashlib import blake2b
+import random
+import re
+import logging
+
+from .models import Recipe, RecipeLSHBucket, normalize_ingredients, normalize_label
+
+logger = logging.getLogger(__name__)
+
+NUM_PERM = 64
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+SHINGLE_SIZE = 5
+
+# Estimated Jaccard similarity from which two recipes count as the same.
+# With 16 bands of 4 rows, pairs this similar share a bucket with probability > 0.99.
+DUPLICATE_THRESHOLD = 0.8
+
+# Recipes whose normalized ingredients and instructions are shorter than this
+# get no signature: empty or stub texts would all look identical.
+MIN_TEXT_LENGTH = 30
+
+# Jaccard similarity of title trigrams a duplicate must also reach, so that
+# different dishes sharing a generic text aren't merged.
+TITLE_SHINGLE_SIZE = 3
+TITLE_THRESHOLD = 0.5
+
+_PRIME = (1 << 61) - 1
+_rng = random.Random(0x5EED)
+_PERMUTATIONS = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(NUM_PERM)]
+
+
+def normalize_text(text):
+    text = re.sub(r'[^\w\s]', ' ', (text or '').lower())
+    return re.sub(r'\s+', ' ', text).strip()
+
+
+def _shingles(ingredients, instructions):
+    """
+    Returns the character shingles of a recipe, or an empty set if its text is too short.
+    """
+    # Ingredient order carries no meaning, so sort them before shingling.
+    names = sorted(normalize_text(name) for name in normalize_ingredients(ingredients or ''))
+    names = ' '.join(name for name in names if name)
+    instructions = normalize_text(instructions)
+    if len(names) + len(instructions) < MIN_TEXT_LENGTH:
+        return set()
+    text = names + ' | ' + instructions
+    return {text[i:i + SHINGLE_SIZE] for i in range(len(text) - SHINGLE_SIZE + 1)}
+
+
+def title_similarity(title, other):
+    """
+    Jaccard similarity of the character trigrams of two normalized titles.
+    """
+    def trigrams(value):
+        value = normalize_text(value)
+        if len(value) <= TITLE_SHINGLE_SIZE:
+            return {value} if value else set()
+        return {value[i:i + TITLE_SHINGLE_SIZE] for i in range(len(value) - TITLE_SHINGLE_SIZE + 1)}
+
+    first, second = trigrams(title), trigrams(other)
+    if not first or not second:
+        return 0.0
+    return len(first & second) / len(first | second)
+
+
+def compute_signature(ingredients, instructions):
+    """
+    Returns the MinHash signature of a recipe as bytes (NUM_PERM uint32 values),
+    or empty bytes if the recipe has too little text (see MIN_TEXT_LENGTH), so
+    it is marked as signed but never indexed.
+    """
+    hashes = [
+        int.from_bytes(blake2b(shingle.encode('utf-8'), digest_size=8).digest(), 'little')
+        for shingle in _shingles(ingredients, instructions)
+    ]
+    if not hashes:
+        return b''
+    signature = array('I', (
+        min((a * h + b) % _PRIME for h in hashes) & 0xFFFFFFFF
+        for a, b in _PERMUTATIONS
+    ))
+    return signature.tobytes()
+
+
+def band_buckets(signature):
+    """
+    Returns one bucket hash per band (signed 64-bit, to fit a BigIntegerField).
+    """
+    size = ROWS * 4
+    return [
+        int.from_bytes(blake2b(signature[band * size:(band + 1) * size], digest_size=8).digest(), 'little', signed=True)
+        for band in range(BANDS)
+    ]
+
+
+def similarity(signature, other):
+    """
+    Estimated Jaccard similarity of two recipes from their signatures.
+    """
+    first, second = array('I', signature), array('I', other)
+    return sum(1 for x, y in zip(first, second) if x == y) / NUM_PERM
+
+
+def index_recipes(recipes):
+    """
+    Replaces the LSH buckets of recipes; recipes without a (non-empty) minhash lose theirs.
+    """
+    if not recipes:
+        return
+    with transaction.atomic():
+        RecipeLSHBucket.objects.filter(recipe__in=[recipe.pk for recipe in recipes]).delete()
+        RecipeLSHBucket.objects.bulk_create([
+            RecipeLSHBucket(recipe_id=recipe.pk, band=band, bucket=bucket)
+            for recipe in recipes if recipe.minhash
+            for band, bucket in enumerate(band_buckets(bytes(recipe.minhash)))
+        ], batch_size=1000)
+
+
+def find_duplicate(title, ingredients, instructions, exclude_pk=None):
+    """
+    Returns (recipe, similarity) for the most similar stored recipe at or above
+    DUPLICATE_THRESHOLD whose title is at least TITLE_THRESHOLD similar, or None.
+    """
+    signature = compute_signature(ingredients, instructions)
+    if not signature:
+        return None
+    buckets = Q()
+    for band, bucket in enumerate(band_buckets(signature)):
+        buckets |= Q(band=band, bucket=bucket)
+
+    candidate_ids = RecipeLSHBucket.objects.filter(buckets).values_list('recipe_id', flat=True).distinct()
+    candidates = Recipe.objects.filter(pk__in=candidate_ids).exclude(pk=exclude_pk).only('id', 'title', 'minhash')
+
+    best = None
+    for candidate in candidates:
+        score = similarity(signature, bytes(candidate.minhash))
+        if score < DUPLICATE_THRESHOLD or title_similarity(title, candidate.title) < TITLE_THRESHOLD:
+            continue
+        if best is None or score > best[1]:
+            best = (candidate, score)
+    return best
+
+
+def save_recipe(recipe_data):
+    """
+    Stores a parsed recipe, merging it into a near-duplicate if there is one.
+
+    A recipe with an existing title updates that recipe, as before. Otherwise,
+    if a stored recipe is a near-duplicate (see find_duplicate), the new data
+    only fills that recipe's empty fields and raises its review count if higher.
+
+    Returns (recipe, outcome, similarity) with outcome 'created', 'updated' or 'merged'.
+    """
+    fields = {
+        'ingredients': recipe_data.get('ingredients') or '',
+        'instructions': recipe_data.get('instructions') or '',
+        'taste': normalize_label(recipe_data.get('taste') or ''),
+        'cuisine_type': normalize_label(recipe_data.get('cuisine_type') or ''),
+        'preparation_time': int(recipe_data.get('preparation_time') or 0),
+        'reviews': int(recipe_data.get('reviews') or 0),
+    }
+    title = recipe_data['title']
+
+    with transaction.atomic():
+        existing = Recipe.objects.filter(title=title).first()
+        if existing is not None:
+            for name, value in fields.items():
+                setattr(existing, name, value)
+            existing.save()
+            return existing, 'updated', None
+
+        duplicate = find_duplicate(title, fields['ingredients'], fields['instructions'])
+        if duplicate is None:
+            return Recipe.objects.create(title=title, **fields), 'created', None
+
+        recipe, score = duplicate
+        recipe = Recipe.objects.get(pk=recipe.pk)
+        for name, value in fields.items():
+            if name == 'reviews':
+                recipe.reviews = max(recipe.reviews, value)
+            elif not getattr(recipe, name) and value:
+                setattr(recipe, name, value)
+        recipe.save()
+        logger.info(f"Merged '{title}' into recipe {recipe.pk} '{recipe.title}' (similarity {score:.2f})")
+        return recipe, 'merged', score
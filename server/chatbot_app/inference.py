@@ -0,0 +1,334 @@
+# chatbot_app/inference.py
+
+from django.conf import settings
+import gc
+import os
+import threading
+import resource
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Models used by the app, keyed by the name callers ask for.
+MODEL_SPECS = {
+    'flan-t5-small': 'google/flan-t5-small',
+    't5-small': 't5-small',
+}
+
+_pipelines = {}
+_pipelines_lock = threading.Lock()
+_worker_state = {'preloaded': False, 'threads': None, 'workers': 1, 'concurrency': 1}
+
+
+def _build_pipeline(name):
+    """
+    Loads a text2text-generation pipeline and prepares its weights for sharing.
+    """
+    from transformers import pipeline
+    import torch
+
+    api_key = os.getenv('LLM_API_KEY')
+    model_id = MODEL_SPECS[name]
+    generator = pipeline(
+        "text2text-generation",
+        model=model_id,
+        tokenizer=model_id,
+        device=0 if torch.cuda.is_available() else -1,
+        token=api_key if api_key else None
+    )
+
+    # Inference only: no autograd bookkeeping, and the weight tensors are never
+    # written after this point, so forked workers keep them on shared pages.
+    generator.model.eval()
+    generator.model.requires_grad_(False)
+    return generator
+
+
+def get_pipeline(name):
+    """
+    Returns the process-wide pipeline for the given model name, loading it on first use.
+    """
+    generator = _pipelines.get(name)
+    if generator is None:
+        with _pipelines_lock:
+            generator = _pipelines.get(name)
+            if generator is None:
+                logger.info(f"Loading model '{name}' in pid {os.getpid()}")
+                generator = _build_pipeline(name)
+                _pipelines[name] = generator
+    return generator
+
+
+def preload_models():
+    """
+    Loads every model before the server forks its workers.
+
+    Only the weights are loaded here; no forward pass is run, so the torch
+    thread pools are not started in the master (they do not survive fork).
+    gc.freeze() moves everything allocated so far out of the collector's
+    reach, so the workers' garbage collections don't dirty the shared pages.
+    """
+    for name in MODEL_SPECS:
+        get_pipeline(name)
+    gc.collect()
+    gc.freeze()
+    _worker_state['preloaded'] = True
+    logger.info(f"Preloaded models {sorted(_pipelines)} in master pid {os.getpid()}")
+
+
+def available_cpus():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def threads_per_worker(workers, concurrency=1):
+    """
+    Splits the available cores between the generations that can run at once,
+    `concurrency` in each of the workers, at least one thread each.
+    """
+    configured = getattr(settings, 'MODEL_THREADS_PER_WORKER', None)
+    if configured:
+        return configured
+    return max(1, available_cpus() // (max(1, workers) * max(1, concurrency)))
+
+
+def configure_worker_threads(workers=None, concurrency=None):
+    """
+    Sets the intra-op thread count for this worker so that N workers, each
+    running up to INFERENCE_MAX_CONCURRENCY generations (or `concurrency`),
+    together don't use more threads than there are cores.
+    """
+    import torch
+
+    workers = workers or getattr(settings, 'MODEL_WORKERS', 1)
+    concurrency = concurrency or settings.INFERENCE_MAX_CONCURRENCY
+    threads = threads_per_worker(workers, concurrency)
+    torch.set_num_threads(threads)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        # Already fixed once inter-op work has run in this process.
+        pass
+    _worker_state['threads'] = threads
+    _worker_state['workers'] = workers
+    _worker_state['concurrency'] = concurrency
+    logger.info(
+        f"Worker pid {os.getpid()} using {threads} intra-op threads "
+        f"({workers} workers, {concurrency} concurrent generations each)"
+    )
+    return threads
+
+
+def warm_up():
+    """
+    Runs one short generation per loaded model so the first request doesn't pay for it.
+    """
+    for name, generator in list(_pipelines.items()):
+        try:
+            generator("warm up", max_length=8, num_return_sequences=1)
+        except Exception as e:
+            logger.error(f"Warm-up of model '{name}' failed: {e}")
+
+
+class InferenceOverloaded(Exception):
+    """
+    Raised when an inference call is shed because too many calls are already waiting.
+    """
+
+
+class DeadlineExceeded(Exception):
+    """
+    Raised by generate_batches when generation was cut off at the deadline.
+    """
+
+
+def generate_batches(generator, prompts, batch_size, deadline=None, **kwargs):
+    """
+    Runs the prompts through a pipeline `batch_size` at a time and returns one
+    output per prompt.
+
+    `deadline` (a time.monotonic() value, or None for no limit) covers the
+    whole call: each batch gets the time left as its max_time. A batch that
+    uses all of it was cut off mid-generation, and DeadlineExceeded is raised.
+    """
+    outputs = []
+    for start in range(0, len(prompts), batch_size):
+        batch = prompts[start:start + batch_size]
+        if deadline is None:
+            outputs.extend(generator(batch, batch_size=batch_size, **kwargs))
+            continue
+        started = time.monotonic()
+        max_time = deadline - started
+        if max_time <= 0:
+            raise DeadlineExceeded(f"No time left for prompts {start} to {start + len(batch) - 1}.")
+        outputs.extend(generator(batch, batch_size=batch_size, max_time=max_time, **kwargs))
+        if time.monotonic() - started >= max_time:
+            raise DeadlineExceeded(f"Generation of prompts {start} to {start + len(batch) - 1} was cut off.")
+    return outputs
+
+
+class AdmissionController:
+    """
+    Admission control around model inference.
+
+    At most `max_concurrency` generations run at once per process. A call is
+    shed (InferenceOverloaded) when `max_queue` calls are already waiting for
+    a slot. It is degraded, i.e. answered by the cheap fallback instead of the
+    model, when the recent queue latency is above `degrade_latency`, when no
+    slot frees up within `queue_timeout`, or when generation runs into the
+    per-call deadline (which includes the time spent queued). Queue latency is a moving average that decays with
+    `half_life`, so degraded mode ends once the backlog has drained.
+    """
+    def __init__(self, max_concurrency, max_queue, queue_timeout, deadline, degrade_latency, half_life=10.0):
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.deadline = deadline
+        self.degrade_latency = degrade_latency
+        self.half_life = half_life
+
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._lock = threading.Lock()
+        self._waiting = 0
+        self._latency = 0.0
+        self._latency_at = time.monotonic()
+        self.counters = {'admitted': 0, 'completed': 0, 'shed': 0, 'degraded': 0, 'timed_out': 0}
+
+    def _count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    def _decayed_latency(self, now):
+        return self._latency * 0.5 ** ((now - self._latency_at) / self.half_life)
+
+    def _record_wait(self, wait):
+        with self._lock:
+            now = time.monotonic()
+            self._latency = 0.8 * self._decayed_latency(now) + 0.2 * wait
+            self._latency_at = now
+
+    def run(self, generate, fallback):
+        """
+        Returns generate(deadline) if the call is admitted and finishes in time,
+        otherwise fallback(). deadline is the time.monotonic() value generation
+        must finish by; generate raises DeadlineExceeded if it was cut off
+        there (see generate_batches).
+        """
+        with self._lock:
+            if self._waiting >= self.max_queue:
+                self.counters['shed'] += 1
+                raise InferenceOverloaded(f"{self._waiting} inference calls already waiting.")
+            degrade = self._decayed_latency(time.monotonic()) > self.degrade_latency
+            if not degrade:
+                self._waiting += 1
+
+        if degrade:
+            self._count('degraded')
+            return fallback()
+
+        start = time.monotonic()
+        acquired = self._slots.acquire(timeout=self.queue_timeout)
+        wait = time.monotonic() - start
+        with self._lock:
+            self._waiting -= 1
+        self._record_wait(wait)
+
+        if not acquired:
+            self._count('degraded')
+            return fallback()
+
+        try:
+            deadline = start + self.deadline
+            if time.monotonic() >= deadline:
+                self._count('degraded')
+                return fallback()
+
+            self._count('admitted')
+            try:
+                result = generate(deadline)
+            except DeadlineExceeded as e:
+                # Generation was cut off at the deadline; its output is incomplete.
+                logger.warning(f"Inference timed out: {e}")
+                self._count('timed_out')
+                self._count('degraded')
+                return fallback()
+            self._count('completed')
+            return result
+        finally:
+            self._slots.release()
+
+    def report(self):
+        with self._lock:
+            return {
+                **self.counters,
+                'waiting': self._waiting,
+                'queue_latency_seconds': round(self._decayed_latency(time.monotonic()), 3),
+            }
+
+
+admission = AdmissionController(
+    max_concurrency=settings.INFERENCE_MAX_CONCURRENCY,
+    max_queue=settings.INFERENCE_MAX_QUEUE,
+    queue_timeout=settings.INFERENCE_QUEUE_TIMEOUT,
+    deadline=settings.INFERENCE_DEADLINE,
+    degrade_latency=settings.INFERENCE_DEGRADE_LATENCY
+)
+
+
+def _read_proc_fields(path, fields):
+    values = {}
+    try:
+        with open(path, 'r') as f:
+            for line in f:
+                key, _, rest = line.partition(':')
+                if key in fields:
+                    values[key] = int(rest.split()[0])
+    except OSError:
+        pass
+    return values
+
+
+def worker_report():
+    """
+    Reports this worker's memory and how much it competes with the other workers for CPU.
+
+    Memory figures are in kB. Pss splits shared pages between the processes
+    mapping them, so summing Pss over workers gives the real footprint;
+    Shared_* shows how much of the preloaded weights is still shared.
+    Non-voluntary context switches grow when workers fight for the cores.
+    """
+    memory = _read_proc_fields('/proc/self/smaps_rollup', {
+        'Rss', 'Pss', 'Shared_Clean', 'Shared_Dirty', 'Private_Clean', 'Private_Dirty',
+    })
+    if not memory:
+        memory = {'MaxRss': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}
+
+    switches = _read_proc_fields('/proc/self/status', {
+        'voluntary_ctxt_switches', 'nonvoluntary_ctxt_switches',
+    })
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    cpus = available_cpus()
+    threads = _worker_state['threads']
+    workers = _worker_state['workers']
+    concurrency = _worker_state['concurrency']
+
+    return {
+        'pid': os.getpid(),
+        'preloaded': _worker_state['preloaded'],
+        'models': sorted(_pipelines),
+        'admission': admission.report(),
+        'memory_kb': memory,
+        'cpu': {
+            'available_cpus': cpus,
+            'workers': workers,
+            'threads_per_worker': threads,
+            'concurrent_generations': concurrency,
+            'oversubscription': round((threads or 1) * workers * concurrency / cpus, 2),
+            'user_seconds': usage.ru_utime,
+            'system_seconds': usage.ru_stime,
+            'voluntary_ctxt_switches': switches.get('voluntary_ctxt_switches'),
+            'nonvoluntary_ctxt_switches': switches.get('nonvoluntary_ctxt_switches'),
+        },
+    }
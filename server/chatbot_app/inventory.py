@@ -0,0 +1,143 @@
+# chatbot_app/inventory.py
+
+from django.db import transaction
+from django.db.models import Case, When, Value, F, FloatField, CharField
+from django.utils import timezone
+import logging
+
+from .models import Ingredient, ChangeLogEntry
+from .changefeed import record_changes
+
+logger = logging.getLogger(__name__)
+
+SET = 'set'
+INCREMENT = 'increment'
+
+# Names per IN (...) lookup, kept under SQLite's bound parameter limit.
+LOOKUP_CHUNK_SIZE = 500
+# Names per increment UPDATE, which binds several parameters per name.
+INCREMENT_CHUNK_SIZE = 100
+
+
+def _merge_items(items, mode):
+    """
+    Collapses repeated names in one request into a single update each.
+    """
+    merged = {}
+    for item in items:
+        current = merged.get(item['name'])
+        if current is None:
+            merged[item['name']] = dict(item)
+            continue
+        if mode == INCREMENT:
+            current['quantity'] += item['quantity']
+        else:
+            current['quantity'] = item['quantity']
+        if 'unit' in item:
+            current['unit'] = item['unit']
+    return merged
+
+
+def _chunks(values, size=LOOKUP_CHUNK_SIZE):
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+def _increment(items, names, new_names):
+    """
+    Adds the item quantities to the stored ones inside the UPDATE, so
+    concurrent increments of the same ingredient all count.
+    """
+    # Missing rows are created empty first. If another request creates one in
+    # the meantime, the insert is skipped and the UPDATE adds to its row instead.
+    Ingredient.objects.bulk_create(
+        [Ingredient(name=name, quantity=0.0, unit=items[name].get('unit')) for name in new_names],
+        batch_size=LOOKUP_CHUNK_SIZE,
+        ignore_conflicts=True
+    )
+
+    now = timezone.now()
+    for chunk in _chunks(names, INCREMENT_CHUNK_SIZE):
+        quantity = Case(
+            *[When(name=name, then=F('quantity') + Value(items[name]['quantity'])) for name in chunk],
+            default=F('quantity'), output_field=FloatField()
+        )
+        unit = Case(
+            *[When(name=name, then=Value(items[name]['unit'])) for name in chunk if 'unit' in items[name]],
+            default=F('unit'), output_field=CharField()
+        )
+        Ingredient.objects.filter(name__in=chunk).update(quantity=quantity, unit=unit, last_updated=now)
+
+
+def apply_inventory_updates(items, mode=SET):
+    """
+    Applies many ingredient updates in one transaction.
+
+    Each item has a name, a quantity and optionally a unit. With mode 'set'
+    the quantity replaces the stock; with 'increment' it is added to it
+    (negative to consume), in the database, so concurrent increments don't
+    overwrite each other. Unknown names are created; an item without a unit
+    keeps the stored one.
+
+    Returns a compact diff:
+    {
+        "created": {name: [quantity, unit]},
+        "updated": {name: {"quantity": [old, new], "unit": [old, new]}},   # changed fields only
+        "unchanged": <count>
+    }
+    """
+    merged = _merge_items(items, mode)
+    names = list(merged)
+    created, updated, unchanged = {}, {}, 0
+
+    with transaction.atomic():
+        existing = {}
+        for chunk in _chunks(names):
+            for name, quantity, unit in (
+                Ingredient.objects.select_for_update()
+                .filter(name__in=chunk)
+                .values_list('name', 'quantity', 'unit')
+            ):
+                existing[name] = (quantity, unit)
+
+        rows = {}
+        for name, item in merged.items():
+            old = existing.get(name)
+            if old is None:
+                quantity, unit = item['quantity'], item.get('unit')
+                created[name] = [quantity, unit]
+            else:
+                old_quantity, old_unit = old
+                quantity = old_quantity + item['quantity'] if mode == INCREMENT else item['quantity']
+                unit = item['unit'] if 'unit' in item else old_unit
+
+                changes = {}
+                if quantity != old_quantity:
+                    changes['quantity'] = [old_quantity, quantity]
+                if unit != old_unit:
+                    changes['unit'] = [old_unit, unit]
+                if not changes:
+                    unchanged += 1
+                    continue
+                updated[name] = changes
+            rows[name] = Ingredient(name=name, quantity=quantity, unit=unit)
+
+        if mode == INCREMENT:
+            _increment(merged, list(rows), [name for name in rows if name in created])
+        else:
+            Ingredient.objects.bulk_create(
+                list(rows.values()),
+                batch_size=LOOKUP_CHUNK_SIZE,
+                update_conflicts=True,
+                unique_fields=['name'],
+                update_fields=['quantity', 'unit', 'last_updated']
+            )
+
+        # Bulk writes don't send signals, so feed the change log directly.
+        changed_ids = []
+        for chunk in _chunks(list(rows)):
+            changed_ids.extend(Ingredient.objects.filter(name__in=chunk).values_list('id', flat=True))
+        record_changes(Ingredient, changed_ids, ChangeLogEntry.UPSERT)
+
+    logger.debug(f"Inventory update: {len(created)} created, {len(updated)} updated, {unchanged} unchanged")
+    return {'created': created, 'updated': updated, 'unchanged': unchanged}
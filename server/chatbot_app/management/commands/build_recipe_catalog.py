@@ -0,0 +1,53 @@
+# chatbot_app/management/commands/build_recipe_catalog.py
+
+from django.core.management.base import BaseCommand
+from django.conf import settings
+from chatbot_app.models import Recipe
+from chatbot_app.catalog import RecipeCatalog, write_catalog, recipes_changed_since
+from chatbot_app.changefeed import ChangeFeedConsumer, visible_seq
+import os
+
+class Command(BaseCommand):
+    help = "Build the read-only recipe catalog snapshot used to serve recommendations."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', type=str, default=None, help='Snapshot path (defaults to RECIPE_CATALOG_PATH)')
+        parser.add_argument('--if-changed', action='store_true', help='Only rebuild if recipes changed since the last build')
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Rows fetched per database round trip')
+
+    def handle(self, *args, **options):
+        path = options['output'] or str(settings.RECIPE_CATALOG_PATH)
+        # One checkpoint per snapshot file, so pruning the change log never
+        # drops entries a snapshot hasn't caught up with.
+        if os.path.abspath(path) == os.path.abspath(settings.RECIPE_CATALOG_PATH):
+            consumer = ChangeFeedConsumer('recipe-catalog', models=[Recipe])
+        else:
+            consumer = ChangeFeedConsumer(f'recipe-catalog:{os.path.abspath(path)}', models=[Recipe])
+
+        if options['if_changed'] and self.is_current(path):
+            self.stdout.write("No recipe changes since the last build. Skipping.")
+            return
+
+        # Taken before reading, so changes made during the build trigger the next one.
+        seq = visible_seq(consumer.checkpoint() or 0)
+        self.stdout.write(f"Building recipe catalog at {path}...")
+
+        rows = Recipe.objects.order_by('taste', 'id').values_list(
+            'id', 'title', 'ingredients', 'instructions', 'taste',
+            'cuisine_type', 'preparation_time', 'reviews'
+        ).iterator(chunk_size=options['chunk_size'])
+
+        count = write_catalog(path, rows, seq=seq)
+        consumer.commit(seq)
+        self.stdout.write(self.style.SUCCESS(f"Recipe catalog written with {count} recipes."))
+
+    def is_current(self, path):
+        """
+        Whether the snapshot at `path` includes every recipe change, judged by
+        the sequence number in its header like get_catalog() does.
+        """
+        try:
+            seq = RecipeCatalog(path).seq
+        except (OSError, ValueError):
+            return False
+        return not recipes_changed_since(seq)
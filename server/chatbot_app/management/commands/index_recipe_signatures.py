@@ -0,0 +1,52 @@
+# chatbot_app/management/commands/index_recipe_signatures.py
+
+from django.core.management.base import BaseCommand
+from chatbot_app.models import Recipe
+from chatbot_app.dedup import compute_signature, index_recipes, find_duplicate
+import json
+
+class Command(BaseCommand):
+    help = "Compute near-duplicate signatures for recipes that lack them and report existing duplicates."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Recompute every signature, not only missing ones')
+        parser.add_argument('--chunk-size', type=int, default=500, help='Recipes signed per batch')
+        parser.add_argument('--report', type=str, default=None, help='Write near-duplicate pairs in the catalog to this JSON file')
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.order_by('id').only('id', 'ingredients', 'instructions', 'minhash')
+        if not options['all']:
+            recipes = recipes.filter(minhash__isnull=True)
+
+        signed = 0
+        batch = []
+        for recipe in recipes.iterator(chunk_size=options['chunk_size']):
+            recipe.minhash = compute_signature(recipe.ingredients, recipe.instructions)
+            batch.append(recipe)
+            if len(batch) >= options['chunk_size']:
+                signed += self.flush(batch)
+                batch = []
+        signed += self.flush(batch)
+        self.stdout.write(self.style.SUCCESS(f"Signed {signed} recipes."))
+
+        if options['report']:
+            pairs = []
+            for recipe in Recipe.objects.order_by('id').only('id', 'title', 'ingredients', 'instructions').iterator():
+                duplicate = find_duplicate(recipe.title, recipe.ingredients, recipe.instructions, exclude_pk=recipe.pk)
+                if duplicate is not None and duplicate[0].pk < recipe.pk:
+                    pairs.append({
+                        'id': recipe.pk,
+                        'title': recipe.title,
+                        'duplicate_of_id': duplicate[0].pk,
+                        'duplicate_of_title': duplicate[0].title,
+                        'similarity': duplicate[1],
+                    })
+            with open(options['report'], 'w', encoding='utf-8') as f:
+                json.dump(pairs, f, indent=2)
+            self.stdout.write(f"Found {len(pairs)} near-duplicate recipes; report written to {options['report']}.")
+
+    def flush(self, batch):
+        if batch:
+            Recipe.objects.bulk_update(batch, ['minhash'])
+            index_recipes(batch)
+        return len(batch)
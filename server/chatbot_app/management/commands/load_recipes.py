@@ -1,8 +1,8 @@
 
 
 from django.core.management.base import BaseCommand
-from chatbot_app.models import Recipe
 from chatbot_app.utils import parse_text_file, parse_unstructured_text
+from chatbot_app.dedup import save_recipe
 import os
 
 class Command(BaseCommand):
@@ -33,32 +33,24 @@ class Command(BaseCommand):
             self.stderr.write(self.style.ERROR(f"Error parsing file: {str(e)}"))
             return
 
+        merged = 0
         for r in recipes_data:
             title = r.get('title')
-            ingredients = r.get('ingredients', '')
-            instructions = r.get('instructions', '')
-            taste = r.get('taste', '')
-            cuisine_type = r.get('cuisine_type', '')
-            preptime = int(r.get('preparation_time', 0))
-            reviews = int(r.get('reviews', 0))
 
             if not title:
                 self.stdout.write(self.style.WARNING("Skipping recipe with no title."))
                 continue
 
-            
-            recipe, created = Recipe.objects.update_or_create(
-                title=title,
-                defaults={
-                    'ingredients': ingredients,
-                    'instructions': instructions,
-                    'taste': taste,
-                    'cuisine_type': cuisine_type,
-                    'preparation_time': preptime,
-                    'reviews': reviews,
-                }
-            )
-            if created:
+            # Create, update (same title) or merge into a near-duplicate
+            recipe, outcome, similarity = save_recipe(r)
+            if outcome == 'created':
                 self.stdout.write(self.style.SUCCESS(f"Recipe '{title}' created."))
-            else:
+            elif outcome == 'updated':
                 self.stdout.write(self.style.WARNING(f"Recipe '{title}' updated."))
+            else:
+                merged += 1
+                self.stdout.write(self.style.WARNING(
+                    f"Recipe '{title}' merged into '{recipe.title}' (similarity {similarity:.2f})."
+                ))
+
+        self.stdout.write(f"Merged {merged} near-duplicate recipes.")
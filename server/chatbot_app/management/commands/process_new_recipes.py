@@ -1,20 +1,23 @@
 # chatbot_app/management/commands/process_new_recipes.py
 
 from django.core.management.base import BaseCommand
-from chatbot_app.models import Recipe
 from chatbot_app.utils import parse_recipe_image, parse_unstructured_text
+from chatbot_app.dedup import save_recipe
 import os
 import glob
+import json
 
 class Command(BaseCommand):
     help = "Process new recipe posts and images and load them into the database."
 
     def add_arguments(self, parser):
         parser.add_argument('input_directory', type=str, help='Directory containing new recipe files and images')
+        parser.add_argument('--report', type=str, default=None, help='Write the merged near-duplicates to this JSON file')
 
     def handle(self, *args, **options):
         input_dir = options['input_directory']
         self.stdout.write(f"Processing new recipes from {input_dir}...")
+        self.merged = []
 
         # Process text files
         text_files = glob.glob(os.path.join(input_dir, '*.txt'))
@@ -24,27 +27,7 @@ class Command(BaseCommand):
                 with open(file_path, 'r', encoding='utf-8') as f:
                     raw_text = f.read()
                 recipe_data = parse_unstructured_text(raw_text)
-                
-                if not recipe_data.get('title'):
-                    self.stdout.write(self.style.WARNING(f"Could not parse recipe from {file_path}. Skipping."))
-                    continue
-
-                # Create or update the recipe
-                recipe, created = Recipe.objects.update_or_create(
-                    title=recipe_data['title'],
-                    defaults={
-                        'ingredients': recipe_data['ingredients'],
-                        'instructions': recipe_data['instructions'],
-                        'taste': recipe_data['taste'],
-                        'cuisine_type': recipe_data['cuisine_type'],
-                        'preparation_time': int(recipe_data['preparation_time'] or 0),
-                        'reviews': int(recipe_data['reviews'] or 0),
-                    }
-                )
-                if created:
-                    self.stdout.write(self.style.SUCCESS(f"Recipe '{recipe.title}' created."))
-                else:
-                    self.stdout.write(self.style.WARNING(f"Recipe '{recipe.title}' updated."))
+                self.store(recipe_data, file_path)
             except Exception as e:
                 self.stderr.write(self.style.ERROR(f"Error processing {file_path}: {e}"))
 
@@ -54,28 +37,37 @@ class Command(BaseCommand):
             self.stdout.write(f"Processing image file: {image_path}")
             try:
                 recipe_data = parse_recipe_image(image_path)
-                
-                if not recipe_data.get('title'):
-                    self.stdout.write(self.style.WARNING(f"Could not parse recipe from {image_path}. Skipping."))
-                    continue
-
-                # Create or update the recipe
-                recipe, created = Recipe.objects.update_or_create(
-                    title=recipe_data['title'],
-                    defaults={
-                        'ingredients': recipe_data['ingredients'],
-                        'instructions': recipe_data['instructions'],
-                        'taste': recipe_data['taste'],
-                        'cuisine_type': recipe_data['cuisine_type'],
-                        'preparation_time': int(recipe_data['preparation_time'] or 0),
-                        'reviews': int(recipe_data['reviews'] or 0),
-                    }
-                )
-                if created:
-                    self.stdout.write(self.style.SUCCESS(f"Recipe '{recipe.title}' created."))
-                else:
-                    self.stdout.write(self.style.WARNING(f"Recipe '{recipe.title}' updated."))
+                self.store(recipe_data, image_path)
             except Exception as e:
                 self.stderr.write(self.style.ERROR(f"Error processing {image_path}: {e}"))
-        
+
+        self.stdout.write(f"Merged {len(self.merged)} near-duplicate recipes.")
+        if options['report']:
+            with open(options['report'], 'w', encoding='utf-8') as f:
+                json.dump(self.merged, f, indent=2)
+            self.stdout.write(f"Duplicate report written to {options['report']}.")
+
         self.stdout.write(self.style.SUCCESS("Processing completed."))
+
+    def store(self, recipe_data, source):
+        if not recipe_data.get('title'):
+            self.stdout.write(self.style.WARNING(f"Could not parse recipe from {source}. Skipping."))
+            return
+
+        # Create, update (same title) or merge into a near-duplicate
+        recipe, outcome, similarity = save_recipe(recipe_data)
+        if outcome == 'created':
+            self.stdout.write(self.style.SUCCESS(f"Recipe '{recipe.title}' created."))
+        elif outcome == 'updated':
+            self.stdout.write(self.style.WARNING(f"Recipe '{recipe.title}' updated."))
+        else:
+            self.stdout.write(self.style.WARNING(
+                f"Recipe '{recipe_data['title']}' merged into '{recipe.title}' (similarity {similarity:.2f})."
+            ))
+            self.merged.append({
+                'source': source,
+                'title': recipe_data['title'],
+                'merged_into_id': recipe.pk,
+                'merged_into_title': recipe.title,
+                'similarity': similarity,
+            })
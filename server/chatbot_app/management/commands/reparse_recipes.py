@@ -0,0 +1,199 @@
+# chatbot_app/management/commands/reparse_recipes.py
+
+from django.core.management.base import BaseCommand
+from django.conf import settings
+from django.db import connections, transaction
+from django.utils import timezone
+from chatbot_app.models import Recipe, ChangeLogEntry, normalize_label
+from chatbot_app.utils import parse_unstructured_texts
+from chatbot_app.inference import get_pipeline, configure_worker_threads
+from chatbot_app.dedup import compute_signature, index_recipes
+from chatbot_app.changefeed import record_changes
+from concurrent.futures import ProcessPoolExecutor
+from collections import deque
+import multiprocessing
+import json
+import os
+
+# Fields the model output may overwrite; title and reviews are kept.
+REPARSED_FIELDS = ['ingredients', 'instructions', 'taste', 'cuisine_type', 'preparation_time']
+
+
+def recipe_text(recipe):
+    return (
+        f"Title: {recipe.title}\n"
+        f"Ingredients: {recipe.ingredients}\n"
+        f"Instructions: {recipe.instructions}\n"
+        f"Taste: {recipe.taste or ''}\n"
+        f"Cuisine: {recipe.cuisine_type or ''}\n"
+        f"PrepTime: {recipe.preparation_time}\n"
+    )
+
+
+def parsed_fields(recipe_data):
+    """
+    Picks the usable fields out of the model output, typed like the Recipe fields.
+    """
+    fields = {}
+    for name in REPARSED_FIELDS:
+        value = recipe_data.get(name)
+        if value in (None, '', []):
+            continue
+        if name == 'preparation_time':
+            try:
+                value = int(value)
+            except (TypeError, ValueError):
+                continue
+        elif isinstance(value, list):
+            value = ', '.join(str(item) for item in value)
+        else:
+            value = str(value)
+        if name in ('taste', 'cuisine_type'):
+            # bulk_update skips Recipe.save, which lowercases these.
+            value = normalize_label(value)
+        fields[name] = value
+    return fields
+
+
+def _init_worker(workers):
+    # Each worker runs one generation at a time (no admission control here).
+    configure_worker_threads(workers, concurrency=1)
+
+
+def _worker_ready():
+    return os.getpid()
+
+
+def _parse_chunk(texts, batch_size):
+    return parse_unstructured_texts(texts, batch_size=batch_size, admit=False)
+
+
+class Command(BaseCommand):
+    help = "Re-run the LLM over stored recipes and write back the re-parsed fields."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=200, help='Recipes read, parsed and written per chunk')
+        parser.add_argument('--batch-size', type=int, default=8, help='Texts per generation batch')
+        parser.add_argument('--workers', type=int, default=1, help='Inference worker processes')
+        parser.add_argument('--checkpoint', type=str, default=os.path.join(settings.BASE_DIR, 'reparse_recipes.checkpoint'),
+                            help='File recording the last recipe id written')
+        parser.add_argument('--resume', action='store_true', help='Continue after the id in the checkpoint file')
+        parser.add_argument('--dry-run', action='store_true', help='Print the changes instead of writing them')
+
+    def handle(self, *args, **options):
+        self.options = options
+        start_after = self.read_checkpoint() if options['resume'] else 0
+        self.stdout.write(f"Re-parsing recipes after id {start_after}...")
+
+        recipes = (
+            Recipe.objects.filter(pk__gt=start_after)
+            .order_by('pk')
+            .only('id', 'title', 'ingredients', 'instructions', 'taste', 'cuisine_type',
+                  'preparation_time', 'reviews')
+        )
+
+        workers = options['workers']
+        pool = None
+        if workers > 1:
+            # Load the model before forking so the workers share its weights,
+            # and don't hand our database connections to the children. The
+            # pool only forks on its first submit, so make that happen now,
+            # before the queryset below opens a connection and a cursor.
+            get_pipeline('flan-t5-small')
+            connections.close_all()
+            pool = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context('fork'),
+                initializer=_init_worker,
+                initargs=(workers,)
+            )
+            pool.submit(_worker_ready).result()
+
+        totals = {'processed': 0, 'changed': 0}
+        try:
+            # At most two chunks per worker are in flight, so memory stays bounded.
+            pending = deque()
+            for chunk in self.chunks(recipes):
+                texts = [recipe_text(recipe) for recipe in chunk]
+                if pool is None:
+                    self.apply(chunk, _parse_chunk(texts, options['batch_size']), totals)
+                    continue
+                pending.append((chunk, pool.submit(_parse_chunk, texts, options['batch_size'])))
+                if len(pending) >= workers * 2:
+                    chunk, future = pending.popleft()
+                    self.apply(chunk, future.result(), totals)
+            while pending:
+                chunk, future = pending.popleft()
+                self.apply(chunk, future.result(), totals)
+        finally:
+            if pool is not None:
+                pool.shutdown(cancel_futures=True)
+
+        verb = "would change" if options['dry_run'] else "changed"
+        self.stdout.write(self.style.SUCCESS(
+            f"Re-parsed {totals['processed']} recipes; {verb} {totals['changed']}."
+        ))
+
+    def chunks(self, recipes):
+        chunk = []
+        for recipe in recipes.iterator(chunk_size=self.options['chunk_size']):
+            chunk.append(recipe)
+            if len(chunk) >= self.options['chunk_size']:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    def apply(self, chunk, results, totals):
+        changed = []
+        for recipe, recipe_data in zip(chunk, results):
+            diff = {
+                name: (getattr(recipe, name), value)
+                for name, value in parsed_fields(recipe_data).items()
+                if getattr(recipe, name) != value
+            }
+            if not diff:
+                continue
+            if self.options['dry_run']:
+                for name, (old, new) in diff.items():
+                    self.stdout.write(f"Recipe {recipe.pk} '{recipe.title}' {name}: {old!r} -> {new!r}")
+            for name, (old, new) in diff.items():
+                setattr(recipe, name, new)
+            changed.append(recipe)
+
+        totals['processed'] += len(chunk)
+        totals['changed'] += len(changed)
+        if self.options['dry_run']:
+            return
+
+        now = timezone.now()
+        for recipe in changed:
+            recipe.popularity = recipe.compute_popularity()
+            recipe.minhash = compute_signature(recipe.ingredients, recipe.instructions)
+            recipe.updated_at = now
+
+        # bulk_update sends no signals, so keep the derived data in step here.
+        with transaction.atomic():
+            Recipe.objects.bulk_update(
+                changed, REPARSED_FIELDS + ['popularity', 'minhash', 'updated_at'], batch_size=500
+            )
+            for recipe in changed:
+                recipe.sync_ingredient_links()
+            index_recipes(changed)
+            record_changes(Recipe, [recipe.pk for recipe in changed], ChangeLogEntry.UPSERT)
+
+        self.write_checkpoint(chunk[-1].pk, totals)
+        self.stdout.write(f"Re-parsed up to recipe {chunk[-1].pk} ({totals['processed']} so far).")
+
+    def read_checkpoint(self):
+        try:
+            with open(self.options['checkpoint'], 'r', encoding='utf-8') as f:
+                return json.load(f)['last_pk']
+        except FileNotFoundError:
+            return 0
+
+    def write_checkpoint(self, last_pk, totals):
+        path = self.options['checkpoint']
+        with open(f"{path}.tmp", 'w', encoding='utf-8') as f:
+            json.dump({'last_pk': last_pk, **totals}, f)
+        os.replace(f"{path}.tmp", path)
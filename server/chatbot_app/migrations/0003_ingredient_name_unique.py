@@ -0,0 +1,58 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:13
+
+from django.db import migrations, models
+from django.db.models import Count
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def merge_duplicate_ingredients(apps, schema_editor):
+    """
+    Merges the rows of each duplicated ingredient name into the most recently
+    updated one. Quantities in the kept row's unit are added to it. Rows in
+    another unit can't be added up; those are merged per unit into one row
+    renamed "<name> (<unit>)", so no stock is lost. Every change is logged.
+    """
+    Ingredient = apps.get_model('chatbot_app', 'Ingredient')
+    duplicated = Ingredient.objects.values('name').annotate(count=Count('id')).filter(count__gt=1)
+    for row in duplicated:
+        keep, *others = Ingredient.objects.filter(name=row['name']).order_by('-last_updated', '-id')
+        by_unit = {}
+        for other in others:
+            by_unit.setdefault(other.unit or '', []).append(other)
+
+        for unit, rows in by_unit.items():
+            target = keep if unit == (keep.unit or '') else rows.pop(0)
+            for other in rows:
+                target.quantity += other.quantity
+                logger.warning(
+                    f"Merged ingredient {other.pk} '{other.name}' ({other.quantity} {other.unit}) into {target.pk}."
+                )
+            if target is not keep:
+                name = f"{keep.name} ({unit or 'no unit'})"[:100]
+                if Ingredient.objects.filter(name=name).exists():
+                    name = f"{name[:90]} #{target.pk}"
+                logger.warning(
+                    f"Renamed ingredient {target.pk} '{target.name}' to '{name}': "
+                    f"its unit ({target.unit}) differs from {keep.pk} ({keep.unit})."
+                )
+                target.name = name
+            target.save(update_fields=['name', 'quantity'])
+            Ingredient.objects.filter(pk__in=[other.pk for other in rows]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatbot_app', '0002_changefeed'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_ingredients, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='ingredient',
+            name='name',
+            field=models.CharField(max_length=100, unique=True),
+        ),
+    ]
@@ -0,0 +1,96 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:14
+
+import django.db.models.deletion
+import math
+from django.db import migrations, models
+from django.db.models.functions import Lower, Trim
+
+
+def backfill_ranking(apps, schema_editor):
+    """
+    Lowercases taste and cuisine type, and fills in popularity and the
+    ingredient links of existing recipes (same rules as Recipe.save,
+    Recipe.compute_popularity and Recipe.sync_ingredient_links).
+    """
+    Recipe = apps.get_model('chatbot_app', 'Recipe')
+    RecipeIngredient = apps.get_model('chatbot_app', 'RecipeIngredient')
+
+    Recipe.objects.update(taste=Lower(Trim('taste')), cuisine_type=Lower(Trim('cuisine_type')))
+
+    batch = []
+    for recipe in Recipe.objects.only('id', 'ingredients', 'reviews', 'preparation_time').iterator(chunk_size=1000):
+        recipe.popularity = math.log1p(max(recipe.reviews, 0)) * 60 / (60 + max(recipe.preparation_time, 0))
+        batch.append(recipe)
+        names = {ing.strip().lower()[:100] for ing in recipe.ingredients.split(',')} - {''}
+        RecipeIngredient.objects.bulk_create(
+            [RecipeIngredient(recipe_id=recipe.id, name=name) for name in names],
+            ignore_conflicts=True
+        )
+        if len(batch) >= 1000:
+            Recipe.objects.bulk_update(batch, ['popularity'])
+            batch = []
+    Recipe.objects.bulk_update(batch, ['popularity'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatbot_app', '0003_ingredient_name_unique'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecipeIngredient',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='popularity',
+            field=models.FloatField(default=0.0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['reviews', 'id'], name='recipe_reviews_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['popularity', 'id'], name='recipe_popularity_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['taste', 'reviews', 'id'], name='recipe_taste_reviews_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['taste', 'popularity', 'id'], name='recipe_taste_popularity_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['cuisine_type', 'reviews', 'id'], name='recipe_cuisine_reviews_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['cuisine_type', 'popularity', 'id'], name='recipe_cuisine_popularity_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['taste', 'cuisine_type', 'reviews', 'id'], name='recipe_taste_cuisine_rev_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['taste', 'cuisine_type', 'popularity', 'id'], name='recipe_taste_cuisine_pop_idx'),
+        ),
+        migrations.AddField(
+            model_name='recipeingredient',
+            name='recipe',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ingredient_links', to='chatbot_app.recipe'),
+        ),
+        migrations.AddConstraint(
+            model_name='recipeingredient',
+            constraint=models.UniqueConstraint(fields=('name', 'recipe'), name='unique_recipe_ingredient'),
+        ),
+        migrations.RunPython(backfill_ranking, migrations.RunPython.noop),
+    ]
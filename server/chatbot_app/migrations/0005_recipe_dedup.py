@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:16
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatbot_app', '0004_recipe_ranking'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='minhash',
+            field=models.BinaryField(null=True),
+        ),
+        migrations.CreateModel(
+            name='RecipeLSHBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('band', models.SmallIntegerField()),
+                ('bucket', models.BigIntegerField()),
+                ('recipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lsh_buckets', to='chatbot_app.recipe')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['band', 'bucket'], name='chatbot_app_band_588240_idx')],
+            },
+        ),
+    ]
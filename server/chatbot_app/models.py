@@ -1,7 +1,23 @@
 from django.db import models
+import math
+
+
+def normalize_ingredients(ingredients):
+    """
+    Splits a recipe's comma-separated ingredients the way recommendations compare them.
+    """
+    return [ing.strip().lower() for ing in ingredients.split(',')]
+
+
+def normalize_label(value):
+    """
+    Stores a recipe's taste or cuisine type lowercased, so filters can match it exactly.
+    """
+    return value.strip().lower() if value is not None else None
+
 
 class Ingredient(models.Model):
-    name = models.CharField(max_length=100)
+    name = models.CharField(max_length=100, unique=True)
     quantity = models.FloatField(default=0.0)
     unit = models.CharField(max_length=30, null=True, blank=True)
     last_updated = models.DateTimeField(auto_now=True)
@@ -18,8 +34,123 @@ class Recipe(models.Model):
     cuisine_type = models.CharField(max_length=100, null=True, blank=True)
     preparation_time = models.IntegerField(default=0)  # In minutes
     reviews = models.IntegerField(default=0)
+    popularity = models.FloatField(default=0.0, editable=False)  # See compute_popularity()
+    minhash = models.BinaryField(null=True, editable=False)  # Near-duplicate signature (empty if too short), see dedup.py
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        # Ranked queries filter on taste and/or cuisine_type and order by
+        # reviews or popularity, with id as the keyset pagination tie-breaker.
+        indexes = [
+            models.Index(fields=['reviews', 'id'], name='recipe_reviews_idx'),
+            models.Index(fields=['popularity', 'id'], name='recipe_popularity_idx'),
+            models.Index(fields=['taste', 'reviews', 'id'], name='recipe_taste_reviews_idx'),
+            models.Index(fields=['taste', 'popularity', 'id'], name='recipe_taste_popularity_idx'),
+            models.Index(fields=['cuisine_type', 'reviews', 'id'], name='recipe_cuisine_reviews_idx'),
+            models.Index(fields=['cuisine_type', 'popularity', 'id'], name='recipe_cuisine_popularity_idx'),
+            models.Index(fields=['taste', 'cuisine_type', 'reviews', 'id'], name='recipe_taste_cuisine_rev_idx'),
+            models.Index(fields=['taste', 'cuisine_type', 'popularity', 'id'], name='recipe_taste_cuisine_pop_idx'),
+        ]
+
     def __str__(self):
         return self.title
+
+    def compute_popularity(self):
+        """
+        Review count on a log scale, discounted for long preparation times:
+        a recipe taking an hour counts half as much as an instant one.
+        """
+        return math.log1p(max(self.reviews, 0)) * 60 / (60 + max(self.preparation_time, 0))
+
+    def save(self, *args, **kwargs):
+        self.taste = normalize_label(self.taste)
+        self.cuisine_type = normalize_label(self.cuisine_type)
+        self.popularity = self.compute_popularity()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'reviews', 'preparation_time'} & set(update_fields):
+            kwargs['update_fields'] = set(update_fields) | {'popularity'}
+        super().save(*args, **kwargs)
+
+    def sync_ingredient_links(self):
+        """
+        Brings the RecipeIngredient rows in line with the ingredients text.
+        """
+        names = {name[:100] for name in normalize_ingredients(self.ingredients)} - {''}
+        current = set(self.ingredient_links.values_list('name', flat=True))
+        if current - names:
+            self.ingredient_links.filter(name__in=current - names).delete()
+        if names - current:
+            RecipeIngredient.objects.bulk_create(
+                [RecipeIngredient(recipe=self, name=name) for name in names - current]
+            )
+
+
+class RecipeIngredient(models.Model):
+    """
+    One normalized ingredient of a recipe, so queries can include or exclude
+    recipes by ingredient through an index instead of scanning the text.
+    """
+    recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE, related_name='ingredient_links')
+    name = models.CharField(max_length=100)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['name', 'recipe'], name='unique_recipe_ingredient'),
+        ]
+
+    def __str__(self):
+        return f"{self.recipe_id}: {self.name}"
+
+
+class RecipeLSHBucket(models.Model):
+    """
+    One LSH band bucket of a recipe's minhash; recipes sharing a bucket are
+    near-duplicate candidates.
+    """
+    recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE, related_name='lsh_buckets')
+    band = models.SmallIntegerField()
+    bucket = models.BigIntegerField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['band', 'bucket']),
+        ]
+
+    def __str__(self):
+        return f"{self.recipe_id}: band {self.band} bucket {self.bucket}"
+
+
+class ChangeLogEntry(models.Model):
+    """
+    One insert/update/delete of a tracked model. The auto-increment id is the
+    sequence number consumers checkpoint against.
+    """
+    UPSERT = 'upsert'
+    DELETE = 'delete'
+    OPERATION_CHOICES = [
+        (UPSERT, 'Upsert'),
+        (DELETE, 'Delete'),
+    ]
+
+    model = models.CharField(max_length=50)           # e.g., recipe, ingredient
+    object_id = models.BigIntegerField()
+    operation = models.CharField(max_length=10, choices=OPERATION_CHOICES)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['model', 'id']),
+        ]
+
+    def __str__(self):
+        return f"#{self.pk} {self.operation} {self.model} {self.object_id}"
+
+
+class ChangeFeedCheckpoint(models.Model):
+    consumer = models.CharField(max_length=100, unique=True)
+    last_seq = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.consumer} @ {self.last_seq}"
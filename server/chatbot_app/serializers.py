@@ -1,19 +1,67 @@
 
 
 from rest_framework import serializers
-from .models import Ingredient, Recipe
+from django.conf import settings
+from .models import Ingredient, Recipe, normalize_ingredients
+import base64
+import json
 
 class IngredientSerializer(serializers.ModelSerializer):
     class Meta:
         model = Ingredient
         fields = '__all__'
 
+class IngredientBulkItemSerializer(serializers.Serializer):
+    name = serializers.CharField(max_length=100)
+    quantity = serializers.FloatField()
+    unit = serializers.CharField(max_length=30, required=False, allow_null=True, allow_blank=True)
+
+
+class IngredientBulkSerializer(serializers.Serializer):
+    mode = serializers.ChoiceField(
+        choices=['set', 'increment'],
+        default='set',
+        help_text="'set' replaces each quantity, 'increment' adds to it."
+    )
+    items = serializers.ListField(
+        child=IngredientBulkItemSerializer(),
+        min_length=1,
+        max_length=settings.INGREDIENT_BULK_MAX_ITEMS
+    )
+
 class RecipeSerializer(serializers.ModelSerializer):
     class Meta:
         model = Recipe
         fields = '__all__'
 
 
+class RecipeQuerySerializer(serializers.Serializer):
+    """
+    Query parameters of GET /recipes/query/.
+    """
+    taste = serializers.CharField(max_length=100, required=False)
+    cuisine_type = serializers.CharField(max_length=100, required=False)
+    max_preparation_time = serializers.IntegerField(min_value=0, required=False)
+    ingredients = serializers.CharField(required=False, help_text="Comma-separated ingredients every result must use.")
+    exclude_ingredients = serializers.CharField(required=False, help_text="Comma-separated ingredients no result may use.")
+    order = serializers.ChoiceField(choices=['reviews', 'popularity'], default='reviews')
+    limit = serializers.IntegerField(min_value=1, max_value=100, default=20)
+    cursor = serializers.CharField(required=False)
+
+    def validate_cursor(self, value):
+        try:
+            sort_value, pk = json.loads(base64.urlsafe_b64decode(value.encode()))
+            return float(sort_value), int(pk)
+        except (ValueError, TypeError):
+            raise serializers.ValidationError("Invalid cursor.")
+
+    def validate_ingredients(self, value):
+        return [name for name in normalize_ingredients(value) if name]
+
+    def validate_exclude_ingredients(self, value):
+        return [name for name in normalize_ingredients(value) if name]
+
+
 class ChatbotQuerySerializer(serializers.Serializer):
     
     preference = serializers.CharField(max_length=200, required=False)
@@ -38,3 +86,13 @@ class ChatbotQuerySerializer(serializers.Serializer):
         if not data.get('message') and not (data.get('preference') and data.get('available_ingredients')):
             raise serializers.ValidationError("Either 'message' or both 'preference' and 'available_ingredients' must be provided.")
         return data
+
+
+class ChatbotBatchSerializer(serializers.Serializer):
+
+    messages = serializers.ListField(
+        child=serializers.CharField(max_length=1000),
+        min_length=1,
+        max_length=settings.CHATBOT_BATCH_MAX_MESSAGES,
+        help_text="Free-form messages, each handled like the 'message' of a single chatbot query."
+    )
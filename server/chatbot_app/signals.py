@@ -0,0 +1,35 @@
+# chatbot_app/signals.py
+
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from .models import Ingredient, Recipe, ChangeLogEntry
+from .changefeed import record_change
+from .dedup import compute_signature, index_recipes
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_save, sender=Ingredient)
+def log_upsert(sender, instance, **kwargs):
+    record_change(sender, instance.pk, ChangeLogEntry.UPSERT)
+
+
+@receiver(post_save, sender=Recipe)
+def sync_recipe_ingredients(sender, instance, **kwargs):
+    instance.sync_ingredient_links()
+
+
+@receiver(pre_save, sender=Recipe)
+def sign_recipe(sender, instance, **kwargs):
+    instance.minhash = compute_signature(instance.ingredients, instance.instructions)
+
+
+@receiver(post_save, sender=Recipe)
+def index_recipe_signature(sender, instance, **kwargs):
+    index_recipes([instance])
+
+
+@receiver(post_delete, sender=Recipe)
+@receiver(post_delete, sender=Ingredient)
+def log_delete(sender, instance, **kwargs):
+    record_change(sender, instance.pk, ChangeLogEntry.DELETE)
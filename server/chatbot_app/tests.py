@@ -1,3 +1,675 @@
-from django.test import TestCase
+from django.core.management import call_command
+from django.test import TestCase, Client, AsyncClient, override_settings
+from django.utils import timezone
+from datetime import timedelta
+from unittest import mock
+from io import StringIO
+import tempfile
+import threading
+import time
+import json
+import os
 
-# Create your tests here.
+from . import inference
+from .models import Recipe, Ingredient, ChangeLogEntry, RecipeLSHBucket
+from .utils import _decode_user_response, parse_user_messages
+from .catalog import RecipeCatalog, write_catalog, get_catalog
+from .views import chatbot_service
+from .changefeed import ChangeFeedConsumer, visible_seq, prune_changelog
+from .dedup import save_recipe, title_similarity, compute_signature, BANDS
+from .inference import AdmissionController, generate_batches, DeadlineExceeded
+from .inventory import apply_inventory_updates, _increment, INCREMENT
+
+NO_CATALOG = '/nonexistent/recipe_catalog.bin'
+
+
+def fake_pipeline(outputs):
+    """
+    Stands in for a text2text-generation pipeline, returning `outputs` as generated texts.
+    """
+    def generate(prompts, **kwargs):
+        return [{'generated_text': text} for text in outputs]
+    return generate
+
+
+@override_settings(RECIPE_CATALOG_PATH=NO_CATALOG, RECIPE_CATALOG_CHECK_INTERVAL=0)
+class ChatbotBatchTests(TestCase):
+    def setUp(self):
+        Recipe.objects.create(
+            title='Chocolate Cake', ingredients='flour, sugar, eggs', instructions='Bake.', taste='sweet'
+        )
+
+    def test_decode_rejects_malformed_output(self):
+        self.assertEqual(_decode_user_response({'generated_text': '["preference", "available_ingredients"]'}), {})
+        self.assertEqual(_decode_user_response({'generated_text': '{"preference": 3, "available_ingredients": []}'}), {})
+        self.assertEqual(_decode_user_response({'generated_text': '{"preference": "sweet", "available_ingredients": [1]}'}), {})
+        self.assertEqual(_decode_user_response({'text': 'no generated_text key'}), {})
+        self.assertEqual(
+            _decode_user_response([{'generated_text': '{"preference": "sweet", "available_ingredients": ["eggs"]}'}]),
+            {'preference': 'sweet', 'available_ingredients': ['eggs']}
+        )
+
+    def test_malformed_item_only_fails_that_item(self):
+        outputs = [
+            '["preference", "available_ingredients"]',
+            json.dumps({'preference': 'sweet', 'available_ingredients': ['flour', 'sugar', 'eggs']}),
+            '{"preference": ["sweet"], "available_ingredients": ["flour"]}',
+        ]
+        with mock.patch('chatbot_app.utils.get_pipeline', return_value=fake_pipeline(outputs)):
+            response = self.client.post(
+                '/api/chatbot/batch/', {'messages': ['a', 'b', 'c']}, content_type='application/json'
+            )
+
+        self.assertEqual(response.status_code, 200)
+        results = response.json()['results']
+        self.assertIn('error', results[0])
+        self.assertEqual([r['title'] for r in results[1]['recommendations']], ['Chocolate Cake'])
+        self.assertIn('error', results[2])
+
+
+@override_settings(RECIPE_CATALOG_CHECK_INTERVAL=0)
+class RecipeCatalogTests(TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = os.path.join(tmp.name, 'recipe_catalog.bin')
+
+        Recipe.objects.create(title='Chocolate Cake', ingredients='flour, sugar, cocoa powder, eggs',
+                              instructions='Bake.', taste='sweet', cuisine_type='dessert', preparation_time=45)
+        Recipe.objects.create(title='Crème brûlée', ingredients='cream, sugar, eggs',
+                              instructions='Bake, then torch.', taste='sweet', cuisine_type='french')
+        Recipe.objects.create(title='Chicken Curry', ingredients='chicken, onion, curry powder',
+                              instructions='Simmer.', taste='spicy', cuisine_type='indian')
+        Recipe.objects.create(title='Plain Rice', ingredients='rice, water', instructions='Boil.')
+
+    def build(self):
+        call_command('build_recipe_catalog', output=self.path, stdout=StringIO())
+
+    def recommend(self, preference, available_ingredients):
+        return sorted(chatbot_service.iter_recommendations(preference, available_ingredients), key=lambda r: r['title'])
+
+    def test_round_trip(self):
+        rows = [
+            (7, 'Untitled', 'a, B ,', 'x', None, None, 0, 0),
+            (3, 'Crème', 'Crème, sugar', 'é', 'sweet', 'french', 12, 40),
+        ]
+        self.assertEqual(write_catalog(self.path, rows, seq=99), 2)
+
+        catalog = RecipeCatalog(self.path)
+        self.assertEqual((catalog.n_recipes, catalog.seq), (2, 99))
+        self.assertEqual(list(catalog.ids), [7, 3])
+        self.assertEqual(catalog.serialize(1), {
+            'title': 'Crème', 'ingredients': ['Crème', ' sugar'], 'instructions': 'é',
+            'taste': 'sweet', 'cuisine_type': 'french', 'preparation_time': 12,
+        })
+        self.assertEqual(catalog.serialize(0)['taste'], None)
+        self.assertIsNotNone(catalog.ingredient_id('crème'))
+        self.assertIsNone(catalog.ingredient_id('pepper'))
+
+    def test_rows_must_be_grouped_by_taste(self):
+        rows = [(1, 't', 'a', 'x', 'sweet', None, 0, 0), (2, 't', 'a', 'x', 'spicy', None, 0, 0),
+                (3, 't', 'a', 'x', 'sweet', None, 0, 0)]
+        with self.assertRaises(ValueError):
+            write_catalog(self.path, rows)
+
+    def test_snapshot_matches_database(self):
+        queries = [
+            ('sweet', ['flour', 'sugar', 'cocoa powder', 'eggs', 'cream']),
+            ('SWE', ['cream', 'sugar', 'eggs']),
+            ('spicy', ['chicken', 'onion']),
+            ('', ['rice', 'water']),
+        ]
+        with override_settings(RECIPE_CATALOG_PATH=NO_CATALOG):
+            expected = [self.recommend(*query) for query in queries]
+
+        self.build()
+        with override_settings(RECIPE_CATALOG_PATH=self.path):
+            self.assertIsNotNone(get_catalog())
+            self.assertEqual([self.recommend(*query) for query in queries], expected)
+            self.assertEqual(
+                [sorted(r, key=lambda r: r['title']) for r in chatbot_service.recommend_recipes_batch(queries)],
+                expected
+            )
+
+    def test_stale_snapshot_falls_back_to_database(self):
+        self.build()
+        with override_settings(RECIPE_CATALOG_PATH=self.path):
+            self.assertIsNotNone(get_catalog())
+
+            Recipe.objects.create(title='Fruit Salad', ingredients='apple, banana',
+                                  instructions='Chop.', taste='sweet')
+            self.assertIsNone(get_catalog())
+            self.assertEqual([r['title'] for r in self.recommend('sweet', ['apple', 'banana'])], ['Fruit Salad'])
+
+            call_command('build_recipe_catalog', output=self.path, if_changed=True, stdout=StringIO())
+            self.assertIsNotNone(get_catalog())
+            self.assertEqual([r['title'] for r in self.recommend('sweet', ['apple', 'banana'])], ['Fruit Salad'])
+
+
+    def test_if_changed_judges_the_target_snapshot(self):
+        # Building another file must not make --if-changed skip a stale main snapshot.
+        other = os.path.join(os.path.dirname(self.path), 'other.bin')
+        with override_settings(RECIPE_CATALOG_PATH=self.path):
+            self.build()
+            Recipe.objects.create(title='Fruit Salad', ingredients='apple, banana', instructions='Chop.', taste='sweet')
+            call_command('build_recipe_catalog', output=other, stdout=StringIO())
+            self.assertIsNone(get_catalog())
+
+            out = StringIO()
+            call_command('build_recipe_catalog', if_changed=True, stdout=out)
+            self.assertNotIn('Skipping', out.getvalue())
+            self.assertIsNotNone(get_catalog())
+
+            out = StringIO()
+            call_command('build_recipe_catalog', if_changed=True, stdout=out)
+            self.assertIn('Skipping', out.getvalue())
+
+@override_settings(CHANGEFEED_SETTLE_SECONDS=60)
+class ChangeFeedTests(TestCase):
+    def setUp(self):
+        self.consumer = ChangeFeedConsumer('test', models=[Recipe])
+
+    def create_recipe(self, title):
+        return Recipe.objects.create(title=title, ingredients='flour', instructions='Bake.', taste='sweet')
+
+    def test_consume_collapses_and_checkpoints(self):
+        recipe = self.create_recipe('Bread')
+        recipe.reviews = 3
+        recipe.save()
+        batches = []
+
+        self.assertEqual(self.consumer.consume(batches.append), 1)
+        self.assertEqual([change.object_id for change in batches[0]], [recipe.pk])
+        self.assertEqual(self.consumer.checkpoint(), ChangeLogEntry.objects.latest('id').id)
+        self.assertEqual(self.consumer.consume(batches.append), 0)
+
+        recipe.delete()
+        self.assertEqual(self.consumer.consume(batches.append), 1)
+        self.assertEqual(batches[-1][0].operation, ChangeLogEntry.DELETE)
+
+    def test_checkpoint_advances_past_other_models(self):
+        self.create_recipe('Bread')
+        self.consumer.consume(lambda changes: None)
+        Ingredient.objects.create(name='salt', quantity=1)
+
+        self.assertEqual(self.consumer.consume(lambda changes: None), 0)
+        self.assertEqual(self.consumer.checkpoint(), ChangeLogEntry.objects.latest('id').id)
+
+    def test_gap_holds_back_later_entries_until_settled(self):
+        first = self.create_recipe('Bread')
+        self.create_recipe('Scones')
+        third = self.create_recipe('Muffins')
+        # The middle entry stands in for a write whose transaction hasn't committed yet.
+        entries = list(ChangeLogEntry.objects.order_by('id'))
+        entries[1].delete()
+
+        changes, last_seq = self.consumer.changes()
+        self.assertEqual([change.object_id for change in changes], [first.pk])
+        self.assertEqual(last_seq, entries[0].id)
+
+        ChangeLogEntry.objects.filter(id=entries[2].id).update(created_at=timezone.now() - timedelta(minutes=5))
+        changes, last_seq = self.consumer.changes()
+        self.assertEqual([change.object_id for change in changes], [first.pk, third.pk])
+        self.assertEqual(last_seq, entries[2].id)
+        self.assertEqual(visible_seq(), entries[2].id)
+
+    def test_prune_keeps_unapplied_entries(self):
+        self.create_recipe('Bread')
+        self.consumer.consume(lambda changes: None)
+        self.create_recipe('Scones')
+
+        self.assertEqual(prune_changelog(), 1)
+        self.assertEqual(len(self.consumer.changes()[0]), 1)
+
+
+class InventoryUpdateTests(TestCase):
+    def setUp(self):
+        Ingredient.objects.create(name='sugar', quantity=500, unit='grams')
+        Ingredient.objects.create(name='eggs', quantity=6)
+
+    def stock(self, name):
+        ingredient = Ingredient.objects.get(name=name)
+        return ingredient.quantity, ingredient.unit
+
+    def test_set_diff(self):
+        diff = apply_inventory_updates([
+            {'name': 'sugar', 'quantity': 400, 'unit': 'grams'},
+            {'name': 'eggs', 'quantity': 6},
+            {'name': 'milk', 'quantity': 1, 'unit': 'liters'},
+        ])
+        self.assertEqual(diff, {
+            'created': {'milk': [1, 'liters']},
+            'updated': {'sugar': {'quantity': [500, 400]}},
+            'unchanged': 1,
+        })
+        self.assertEqual(self.stock('sugar'), (400, 'grams'))
+
+    def test_increment_diff(self):
+        diff = apply_inventory_updates([
+            {'name': 'sugar', 'quantity': -50},
+            {'name': 'sugar', 'quantity': -25},
+            {'name': 'eggs', 'quantity': 0, 'unit': 'pieces'},
+            {'name': 'milk', 'quantity': 2, 'unit': 'liters'},
+        ], mode=INCREMENT)
+        self.assertEqual(diff, {
+            'created': {'milk': [2, 'liters']},
+            'updated': {'sugar': {'quantity': [500, 425]}, 'eggs': {'unit': [None, 'pieces']}},
+            'unchanged': 0,
+        })
+        self.assertEqual(self.stock('sugar'), (425, 'grams'))
+        self.assertEqual(self.stock('eggs'), (6, 'pieces'))
+        self.assertEqual(self.stock('milk'), (2, 'liters'))
+
+    def test_increment_adds_to_rows_written_concurrently(self):
+        # Another request raised the stock and created 'flour' after this one read them.
+        items = {'sugar': {'name': 'sugar', 'quantity': 10}, 'flour': {'name': 'flour', 'quantity': 3, 'unit': 'cups'}}
+        Ingredient.objects.filter(name='sugar').update(quantity=600)
+        Ingredient.objects.create(name='flour', quantity=1, unit='cups')
+
+        _increment(items, ['sugar', 'flour'], ['flour'])
+        self.assertEqual(self.stock('sugar'), (610, 'grams'))
+        self.assertEqual(self.stock('flour'), (4, 'cups'))
+
+    def test_changes_are_logged(self):
+        apply_inventory_updates([{'name': 'sugar', 'quantity': 1}, {'name': 'eggs', 'quantity': 6}])
+        sugar = Ingredient.objects.get(name='sugar')
+        self.assertEqual(
+            list(ChangeLogEntry.objects.filter(model='ingredient').values_list('object_id', flat=True))[-1:],
+            [sugar.pk]
+        )
+
+
+class RecipeQueryTests(TestCase):
+    def setUp(self):
+        for index in range(7):
+            Recipe.objects.create(
+                title=f'Pasta {index}', ingredients='pasta, tomato' if index % 2 else 'pasta, cream',
+                instructions='Boil.', taste='Savory', cuisine_type='Italian', reviews=index % 3
+            )
+        Recipe.objects.create(title='Curry', ingredients='rice', instructions='Simmer.', taste='spicy', cuisine_type='Indian')
+
+    def query(self, **params):
+        response = self.client.get('/api/recipes/query/', params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def test_labels_are_stored_lowercased(self):
+        recipe = Recipe.objects.get(title='Pasta 0')
+        self.assertEqual((recipe.taste, recipe.cuisine_type), ('savory', 'italian'))
+
+    def test_filters_ignore_case(self):
+        self.assertEqual(len(self.query(cuisine_type='Italian', limit=100)['results']), 7)
+        self.assertEqual(len(self.query(taste='SAVORY', cuisine_type='italian', limit=100)['results']), 7)
+        self.assertEqual(self.query(cuisine_type='indian')['results'][0]['title'], 'Curry')
+
+    def test_ingredient_filters(self):
+        titles = {recipe['title'] for recipe in self.query(ingredients='Tomato', limit=100)['results']}
+        self.assertEqual(titles, {'Pasta 1', 'Pasta 3', 'Pasta 5'})
+        titles = {recipe['title'] for recipe in self.query(cuisine_type='italian', exclude_ingredients='tomato', limit=100)['results']}
+        self.assertEqual(titles, {'Pasta 0', 'Pasta 2', 'Pasta 4', 'Pasta 6'})
+
+    def test_keyset_cursor_walks_every_recipe_once(self):
+        for order in ('reviews', 'popularity'):
+            expected = list(
+                Recipe.objects.filter(cuisine_type='italian').order_by(f'-{order}', '-id').values_list('title', flat=True)
+            )
+            titles, cursor = [], None
+            while True:
+                params = {'cuisine_type': 'Italian', 'order': order, 'limit': 3}
+                if cursor:
+                    params['cursor'] = cursor
+                page = self.query(**params)
+                titles += [recipe['title'] for recipe in page['results']]
+                cursor = page['next_cursor']
+                if cursor is None:
+                    break
+            self.assertEqual(titles, expected)
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/api/recipes/query/', {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 400)
+
+
+class RecipeDedupTests(TestCase):
+    INGREDIENTS = 'flour, sugar, cocoa powder, eggs, butter, baking powder'
+    INSTRUCTIONS = 'Preheat the oven to 180C. Mix the dry ingredients, beat in the eggs and butter, bake for 35 minutes.'
+
+    def recipe_data(self, title, ingredients=INGREDIENTS, instructions=INSTRUCTIONS, **fields):
+        return {'title': title, 'ingredients': ingredients, 'instructions': instructions, **fields}
+
+    def test_ocr_noise_is_merged(self):
+        original, outcome, _ = save_recipe(self.recipe_data('Chocolate Cake', reviews=3))
+        self.assertEqual(outcome, 'created')
+
+        noisy = self.recipe_data(
+            'Choc0late Cake',
+            ingredients='fl0ur, sugar, cocoa powder, eggs, butter, baking powder',
+            instructions=self.INSTRUCTIONS.replace('dry', 'drv').replace('butter', 'buttcr'),
+            cuisine_type='French', reviews=10
+        )
+        recipe, outcome, score = save_recipe(noisy)
+        self.assertEqual((recipe.pk, outcome), (original.pk, 'merged'))
+        self.assertGreaterEqual(score, 0.8)
+        self.assertEqual((recipe.title, recipe.cuisine_type, recipe.reviews), ('Chocolate Cake', 'french', 10))
+        self.assertEqual(Recipe.objects.count(), 1)
+
+    def test_same_title_updates(self):
+        original, _, _ = save_recipe(self.recipe_data('Chocolate Cake'))
+        recipe, outcome, _ = save_recipe(self.recipe_data('Chocolate Cake', instructions='Bake it.'))
+        self.assertEqual((recipe.pk, outcome, recipe.instructions), (original.pk, 'updated', 'Bake it.'))
+
+    def test_empty_and_short_texts_are_not_merged(self):
+        for title in ('Lemonade', 'Iced Tea', 'Lemonade Jug'):
+            _, outcome, _ = save_recipe(self.recipe_data(title, ingredients='', instructions=''))
+            self.assertEqual(outcome, 'created')
+        for title in ('Toast', 'Toasty'):
+            _, outcome, _ = save_recipe(self.recipe_data(title, ingredients='bread', instructions='Toast it.'))
+            self.assertEqual(outcome, 'created')
+        self.assertEqual(Recipe.objects.count(), 5)
+        self.assertFalse(RecipeLSHBucket.objects.exists())
+
+    def test_different_title_is_not_merged(self):
+        save_recipe(self.recipe_data('Chocolate Cake'))
+        _, outcome, _ = save_recipe(self.recipe_data('Banana Bread'))
+        self.assertEqual(outcome, 'created')
+        self.assertEqual(Recipe.objects.count(), 2)
+
+    def test_title_similarity(self):
+        self.assertEqual(title_similarity('Chocolate Cake', 'chocolate cake!'), 1.0)
+        self.assertGreaterEqual(title_similarity('Chocolate Cake', 'Choc0late Cake'), 0.5)
+        self.assertLess(title_similarity('Chocolate Cake', 'Banana Bread'), 0.5)
+        self.assertEqual(title_similarity('', 'Banana Bread'), 0.0)
+
+    def test_buckets_dropped_when_text_becomes_too_short(self):
+        recipe, _, _ = save_recipe(self.recipe_data('Chocolate Cake'))
+        self.assertEqual(recipe.lsh_buckets.count(), BANDS)
+        recipe.ingredients, recipe.instructions = '', ''
+        recipe.save()
+        self.assertEqual(recipe.lsh_buckets.count(), 0)
+
+    def test_short_recipes_are_signed_once(self):
+        short = Recipe.objects.create(title='Toast', ingredients='bread', instructions='Toast it.')
+        self.assertEqual(bytes(Recipe.objects.get(pk=short.pk).minhash), b'')
+        self.assertEqual(compute_signature('', ''), b'')
+
+        Recipe.objects.filter(pk=short.pk).update(minhash=None)
+        out = StringIO()
+        call_command('index_recipe_signatures', stdout=out)
+        self.assertIn('Signed 1 recipes.', out.getvalue())
+        out = StringIO()
+        call_command('index_recipe_signatures', stdout=out)
+        self.assertIn('Signed 0 recipes.', out.getvalue())
+
+
+class AdmissionControlTests(TestCase):
+    def test_spike_is_shed(self):
+        # One generation at a time with two calls allowed to wait: of eight
+        # concurrent requests one generates, two queue and five get 503.
+        controller = AdmissionController(
+            max_concurrency=1, max_queue=2, queue_timeout=10, deadline=10, degrade_latency=10
+        )
+        release = threading.Event()
+
+        def generate(prompts, **kwargs):
+            release.wait(10)
+            return [{'generated_text': 'not json'} for _ in prompts]
+
+        statuses = []
+
+        def request():
+            response = Client().post('/api/chatbot/', {'message': 'sweet, I have eggs'}, content_type='application/json')
+            statuses.append(response.status_code)
+
+        with mock.patch('chatbot_app.utils.admission', controller), \
+                mock.patch('chatbot_app.utils.get_pipeline', return_value=generate):
+            threads = [threading.Thread(target=request) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            started = time.monotonic()
+            while controller.counters['shed'] < 5 and time.monotonic() - started < 10:
+                time.sleep(0.01)
+            release.set()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(sorted(statuses), [400] * 3 + [503] * 5)
+        self.assertEqual(controller.counters['shed'], 5)
+        self.assertEqual(controller.counters['completed'], 3)
+
+    def test_shed_response_asks_to_retry(self):
+        controller = AdmissionController(
+            max_concurrency=1, max_queue=0, queue_timeout=1, deadline=10, degrade_latency=10
+        )
+        with mock.patch('chatbot_app.utils.admission', controller):
+            response = self.client.post('/api/chatbot/', {'message': 'sweet, I have eggs'}, content_type='application/json')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '1')
+
+
+class InferenceDeadlineTests(TestCase):
+    def controller(self, deadline=10):
+        return AdmissionController(
+            max_concurrency=1, max_queue=4, queue_timeout=1, deadline=deadline, degrade_latency=10
+        )
+
+    def test_one_deadline_spans_all_batches(self):
+        max_times = []
+
+        def generate(prompts, max_time=None, **kwargs):
+            max_times.append(max_time)
+            return [{'generated_text': json.dumps({'preference': 'sweet', 'available_ingredients': [p[-1]]})}
+                    for p in prompts]
+
+        controller = self.controller()
+        with mock.patch('chatbot_app.utils.admission', controller), \
+                mock.patch('chatbot_app.utils.get_pipeline', return_value=generate), \
+                mock.patch('chatbot_app.utils._user_message_prompt', side_effect=lambda m: m):
+            results = parse_user_messages(['a', 'b', 'c', 'd', 'e'], batch_size=2)
+
+        self.assertEqual([r['available_ingredients'] for r in results], [['a'], ['b'], ['c'], ['d'], ['e']])
+        self.assertEqual(len(max_times), 3)
+        self.assertTrue(all(0 < later <= earlier <= 10 for earlier, later in zip(max_times, max_times[1:])))
+        self.assertEqual(controller.counters['completed'], 1)
+
+    def test_batches_finishing_in_time_are_kept(self):
+        # Three batches within one shared deadline: none is cut off, so the output is kept.
+        def generate(prompts, max_time=None, **kwargs):
+            time.sleep(0.05)
+            return list(prompts)
+
+        controller = self.controller(deadline=1)
+        result = controller.run(lambda deadline: generate_batches(generate, [1, 2, 3], 1, deadline), fallback=lambda: 'fallback')
+        self.assertEqual(result, [1, 2, 3])
+        self.assertEqual(controller.counters['timed_out'], 0)
+
+    def test_cut_off_batch_falls_back(self):
+        def generate(prompts, max_time=None, **kwargs):
+            # Stands in for a generation stopped by max_time.
+            time.sleep(max_time or 0)
+            return list(prompts)
+
+        controller = self.controller(deadline=0.1)
+        result = controller.run(lambda deadline: generate_batches(generate, [1, 2], 1, deadline), fallback=lambda: 'fallback')
+        self.assertEqual(result, 'fallback')
+        self.assertEqual(controller.counters['timed_out'], 1)
+
+        with self.assertRaises(DeadlineExceeded):
+            generate_batches(generate, [1], 1, deadline=time.monotonic() - 1)
+        self.assertEqual(generate_batches(generate, [1, 2], 1, deadline=None), [1, 2])
+
+
+class ModelRegistryTests(TestCase):
+    def test_pipeline_is_loaded_once(self):
+        with mock.patch.dict(inference._pipelines, clear=True), \
+                mock.patch('chatbot_app.inference._build_pipeline', side_effect=lambda name: object()) as build:
+            first = inference.get_pipeline('t5-small')
+            self.assertIs(inference.get_pipeline('t5-small'), first)
+            self.assertIsNot(inference.get_pipeline('flan-t5-small'), first)
+        self.assertEqual([c.args for c in build.call_args_list], [('t5-small',), ('flan-t5-small',)])
+
+    @override_settings(MODEL_THREADS_PER_WORKER=None)
+    def test_threads_split_the_cores_between_workers(self):
+        with mock.patch('chatbot_app.inference.available_cpus', return_value=8):
+            self.assertEqual(inference.threads_per_worker(1), 8)
+            self.assertEqual(inference.threads_per_worker(4), 2)
+            self.assertEqual(inference.threads_per_worker(3), 2)
+            self.assertEqual(inference.threads_per_worker(16), 1)
+            self.assertEqual(inference.threads_per_worker(2, concurrency=2), 2)
+            self.assertEqual(inference.threads_per_worker(4, concurrency=3), 1)
+
+    @override_settings(MODEL_THREADS_PER_WORKER=3)
+    def test_thread_override(self):
+        with mock.patch('chatbot_app.inference.available_cpus', return_value=8):
+            self.assertEqual(inference.threads_per_worker(4), 3)
+
+    @override_settings(MODEL_THREADS_PER_WORKER=None, MODEL_WORKERS=2, INFERENCE_MAX_CONCURRENCY=2)
+    def test_configure_worker_threads(self):
+        # Two workers with two concurrent generations each share the 8 cores.
+        with mock.patch('chatbot_app.inference.available_cpus', return_value=8), \
+                mock.patch('torch.set_num_threads') as set_num_threads, \
+                mock.patch('torch.set_num_interop_threads'), \
+                mock.patch.dict(inference._worker_state):
+            self.assertEqual(inference.configure_worker_threads(), 2)
+            cpu = inference.worker_report()['cpu']
+            self.assertEqual((cpu['threads_per_worker'], cpu['concurrent_generations']), (2, 2))
+            self.assertEqual(cpu['oversubscription'], 1.0)
+
+            self.assertEqual(inference.configure_worker_threads(concurrency=1), 4)
+        set_num_threads.assert_has_calls([mock.call(2), mock.call(4)])
+
+
+@override_settings(RECIPE_CATALOG_PATH=NO_CATALOG, RECIPE_CATALOG_CHECK_INTERVAL=0)
+class ChatbotStreamTests(TestCase):
+    def setUp(self):
+        Recipe.objects.create(title='Chocolate Cake', ingredients='flour, sugar, eggs', instructions='Bake.', taste='sweet')
+        Recipe.objects.create(title='Meringue', ingredients='sugar, eggs', instructions='Whisk.', taste='sweet')
+        Recipe.objects.create(title='Omelette', ingredients='eggs', instructions='Fry.', taste='savory')
+
+    async def stream(self, body, accept='text/event-stream'):
+        response = await AsyncClient().post(
+            '/api/chatbot/stream/', body, content_type='application/json', headers={'Accept': accept}
+        )
+        content = b''.join([chunk async for chunk in response.streaming_content]).decode()
+        return response, content
+
+    @staticmethod
+    def sse_events(content):
+        events = []
+        for block in filter(None, content.split('\n\n')):
+            event_line, data_line = block.split('\n')
+            events.append((event_line.removeprefix('event: '), json.loads(data_line.removeprefix('data: '))))
+        return events
+
+    async def test_sse_event_order(self):
+        response, content = await self.stream(
+            {'preference': 'sweet', 'available_ingredients': ['flour', 'sugar', 'eggs']}
+        )
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        events = self.sse_events(content)
+        self.assertEqual([event for event, _ in events], ['parsed', 'recommendation', 'recommendation', 'done'])
+        self.assertEqual(events[0][1], {'preference': 'sweet', 'available_ingredients': ['flour', 'sugar', 'eggs']})
+        self.assertEqual({data['title'] for _, data in events[1:3]}, {'Chocolate Cake', 'Meringue'})
+        self.assertEqual(events[-1][1], {'count': 2})
+
+    async def test_ndjson_from_parsed_message(self):
+        output = json.dumps({'preference': 'savory', 'available_ingredients': ['eggs']})
+        with mock.patch('chatbot_app.utils.get_pipeline', return_value=fake_pipeline([output])):
+            response, content = await self.stream({'message': 'Something savory, I have eggs'}, accept='application/x-ndjson')
+
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = [json.loads(line) for line in content.splitlines()]
+        self.assertEqual([line['event'] for line in lines], ['parsed', 'recommendation', 'done'])
+        self.assertEqual(lines[1]['data']['title'], 'Omelette')
+
+    async def test_invalid_json(self):
+        response = await AsyncClient().post('/api/chatbot/stream/', 'not json', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(json.loads(response.content), {'error': 'Request body must be valid JSON.'})
+
+    async def test_overload_ends_with_error_event(self):
+        controller = AdmissionController(
+            max_concurrency=1, max_queue=0, queue_timeout=1, deadline=10, degrade_latency=10
+        )
+        with mock.patch('chatbot_app.utils.admission', controller):
+            response, content = await self.stream({'message': 'Something sweet, I have eggs'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.sse_events(content), [('error', {'error': 'The model is overloaded, please retry shortly.'})])
+
+    async def test_unparseable_message_ends_with_error_event(self):
+        with mock.patch('chatbot_app.utils.get_pipeline', return_value=fake_pipeline(['not json'])):
+            _, content = await self.stream({'message': 'hello'})
+        self.assertEqual([event for event, _ in self.sse_events(content)], ['error'])
+
+
+class ReparseRecipesTests(TestCase):
+    PARSED = {
+        'ingredients': ['beans', 'Chili', 'tomato'],
+        'instructions': 'Simmer the beans with chili and tomato for an hour.',
+        'taste': 'Spicy',
+        'cuisine_type': 'Mexican',
+        'preparation_time': '60',
+    }
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.checkpoint = os.path.join(tmp.name, 'reparse.checkpoint')
+
+        self.chili = Recipe.objects.create(title='Chili', ingredients='beans', instructions='Cook.', reviews=4)
+        self.toast = Recipe.objects.create(title='Toast', ingredients='bread', instructions='Toast it.', taste='savory')
+        self.tacos = Recipe.objects.create(title='Tacos', ingredients='tortillas', instructions='Fill.')
+
+    @staticmethod
+    def generate(prompts, **kwargs):
+        # The model can't parse the toast recipe; the others come back as chili.
+        return [
+            {'generated_text': 'not json' if 'Title: Toast' in prompt else json.dumps(ReparseRecipesTests.PARSED)}
+            for prompt in prompts
+        ]
+
+    def reparse(self, **options):
+        out = StringIO()
+        with mock.patch('chatbot_app.utils.get_pipeline', return_value=self.generate):
+            call_command('reparse_recipes', checkpoint=self.checkpoint, chunk_size=2, stdout=out, **options)
+        return out.getvalue()
+
+    def test_dry_run_writes_nothing(self):
+        seq = ChangeLogEntry.objects.latest('id').id
+        out = self.reparse(dry_run=True)
+
+        self.assertIn("Re-parsed 3 recipes; would change 2.", out)
+        self.assertIn(f"Recipe {self.chili.pk} 'Chili' taste: None -> 'spicy'", out)
+        self.assertEqual(Recipe.objects.get(pk=self.chili.pk).ingredients, 'beans')
+        self.assertFalse(ChangeLogEntry.objects.filter(id__gt=seq).exists())
+        self.assertFalse(os.path.exists(self.checkpoint))
+
+    def test_write_back_keeps_derived_data_in_step(self):
+        seq = ChangeLogEntry.objects.latest('id').id
+        out = self.reparse()
+        self.assertIn("Re-parsed 3 recipes; changed 2.", out)
+
+        chili = Recipe.objects.get(pk=self.chili.pk)
+        self.assertEqual(
+            (chili.ingredients, chili.taste, chili.cuisine_type, chili.preparation_time, chili.title, chili.reviews),
+            ('beans, Chili, tomato', 'spicy', 'mexican', 60, 'Chili', 4)
+        )
+        self.assertEqual(chili.popularity, chili.compute_popularity())
+        self.assertEqual(set(chili.ingredient_links.values_list('name', flat=True)), {'beans', 'chili', 'tomato'})
+        self.assertEqual(bytes(chili.minhash), compute_signature(chili.ingredients, chili.instructions))
+        self.assertEqual(chili.lsh_buckets.count(), BANDS)
+        self.assertEqual(Recipe.objects.get(pk=self.toast.pk).ingredients, 'bread')
+
+        changed = ChangeLogEntry.objects.filter(id__gt=seq, model='recipe').values_list('object_id', flat=True)
+        self.assertEqual(sorted(changed), [self.chili.pk, self.tacos.pk])
+        with open(self.checkpoint, encoding='utf-8') as f:
+            self.assertEqual(json.load(f), {'last_pk': self.tacos.pk, 'processed': 3, 'changed': 2})
+
+    def test_resume_continues_after_checkpoint(self):
+        with open(self.checkpoint, 'w', encoding='utf-8') as f:
+            json.dump({'last_pk': self.chili.pk}, f)
+
+        out = self.reparse(resume=True)
+        self.assertIn(f"Re-parsing recipes after id {self.chili.pk}...", out)
+        self.assertIn("Re-parsed 2 recipes; changed 1.", out)
+        self.assertEqual(Recipe.objects.get(pk=self.chili.pk).ingredients, 'beans')
+        self.assertEqual(Recipe.objects.get(pk=self.tacos.pk).taste, 'spicy')
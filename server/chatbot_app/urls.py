@@ -4,20 +4,32 @@ from django.urls import path
 from .views import (
     IngredientListCreateView,
     IngredientDetailView,
+    IngredientBulkView,
     RecipeListCreateView,
     RecipeDetailView,
+    RecipeQueryView,
     ChatbotView,
+    ChatbotStreamView,
+    ChatbotBatchView,
+    ModelStatusView,
 )
 
 urlpatterns = [
     # Ingredient Endpoints
     path('ingredients/', IngredientListCreateView.as_view(), name='ingredient-list-create'),
+    path('ingredients/bulk/', IngredientBulkView.as_view(), name='ingredient-bulk'),
     path('ingredients/<int:pk>/', IngredientDetailView.as_view(), name='ingredient-detail'),
     
     # Recipe Endpoints
     path('recipes/', RecipeListCreateView.as_view(), name='recipe-list-create'),
+    path('recipes/query/', RecipeQueryView.as_view(), name='recipe-query'),
     path('recipes/<int:pk>/', RecipeDetailView.as_view(), name='recipe-detail'),
     
     # Chatbot Endpoint
     path('chatbot/', ChatbotView.as_view(), name='chatbot'),
+    path('chatbot/batch/', ChatbotBatchView.as_view(), name='chatbot-batch'),
+    path('chatbot/stream/', ChatbotStreamView.as_view(), name='chatbot-stream'),
+
+    # Model Status Endpoint
+    path('models/status/', ModelStatusView.as_view(), name='model-status'),
 ]
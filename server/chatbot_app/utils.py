@@ -2,13 +2,12 @@
 
 import pytesseract
 from PIL import Image
-from transformers import pipeline
-import os
-import torch
 import json
 import logging
 import re
 
+from .inference import get_pipeline, generate_batches, admission, InferenceOverloaded
+
 logger = logging.getLogger(__name__)
 
 def clean_user_message(message):
@@ -30,23 +29,8 @@ def parse_text_file(file_path):
     pass 
 
 
-def parse_unstructured_text(text):
-    """
-    Uses an LLM to parse unstructured recipe text into structured fields.
-    """
-   
-    if not hasattr(parse_unstructured_text, "parser"):
-        api_key = os.getenv('LLM_API_KEY')
-        parse_unstructured_text.parser = pipeline(
-            "text2text-generation",
-            model="google/flan-t5-small",
-            tokenizer="google/flan-t5-small",
-            device=0 if torch.cuda.is_available() else -1,
-            use_auth_token=api_key if api_key else None
-        )
-
-   
-    prompt = (
+def _recipe_text_prompt(text):
+    return (
         "You are an assistant that extracts food preferences and available ingredients from user messages.\n"
         "Given the user's message, identify their taste preference and list of available ingredients.\n"
         "Respond ONLY with a JSON object containing the keys: 'preference' and 'available_ingredients'.\n"
@@ -54,52 +38,64 @@ def parse_unstructured_text(text):
         f"Recipe Text: {text}"
     )
 
-   
+
+def _decode_recipe_response(structured_data):
+    logger.debug(f"LLM Response for recipe text: {structured_data}")
     try:
-        response = parse_unstructured_text.parser(prompt, max_length=512, num_return_sequences=1)
-        structured_data = response[0]['generated_text']
-        logger.debug(f"LLM Response for recipe text: {structured_data}")
-        
-       
         recipe_data = json.loads(structured_data)
         logger.debug(f"Parsed Recipe Data: {recipe_data}")
     except json.JSONDecodeError as jde:
         logger.error(f"JSON decoding failed: {jde}")
         recipe_data = {}
-    except Exception as e:
-       
-        logger.error(f"Error parsing recipe with LLM: {e}")
-        recipe_data = {}
+    return recipe_data if isinstance(recipe_data, dict) else {}
 
-    return recipe_data
 
-from transformers import pipeline
-import os
-import logging
-import json
-import re
+def parse_unstructured_text(text):
+    """
+    Uses an LLM to parse unstructured recipe text into structured fields.
+    """
+    return parse_unstructured_texts([text])[0]
 
-logger = logging.getLogger(__name__)
 
-def parse_user_message(message):
+def parse_unstructured_texts(texts, batch_size=8, admit=True):
     """
-    Uses an LLM to parse the user's free-form message into structured preferences and ingredients.
+    Parses many recipe texts with batched generation.
+    Returns one dict per text, in order; a text that could not be parsed gets {}.
+
+    With admit=False the call bypasses admission control (no deadline, no
+    keyword fallback), for offline jobs that must get the model's output.
     """
-   
+    if not texts:
+        return []
+
+    prompts = [_recipe_text_prompt(text) for text in texts]
+
+    def generate(deadline):
+        parser = get_pipeline('flan-t5-small')
+        responses = generate_batches(parser, prompts, batch_size, deadline, max_length=512, num_return_sequences=1)
+        parsed = []
+        for response in responses:
+            # A list input comes back flattened to one dict per prompt.
+            if isinstance(response, list):
+                response = response[0]
+            parsed.append(_decode_recipe_response(response['generated_text']))
+        return parsed
+
+    try:
+        if not admit:
+            return generate(None)
+        return admission.run(generate, fallback=lambda: [keyword_parse_recipe_text(text) for text in texts])
+    except InferenceOverloaded:
+        raise
+    except Exception as e:
+        logger.error(f"Error parsing recipe with LLM: {e}")
+        return [{} for _ in texts]
+
+def _user_message_prompt(message):
     cleaned_message = re.sub(r'[^\w\s,]', '', message).strip()
     logger.debug(f"Cleaned User Message: {cleaned_message}")
 
-   
-    if not hasattr(parse_user_message, "parser"):
-        parse_user_message.parser = pipeline(
-            "text2text-generation",
-            model="t5-small", 
-            tokenizer="t5-small",
-            device=0 if torch.cuda.is_available() else -1
-        )
-
-   
-    prompt = (
+    return (
         "You are an assistant that extracts food preferences and available ingredients from user messages.\n"
         "Respond ONLY with a JSON object containing 'preference' (a string) and 'available_ingredients' (a list of strings).\n"
         "Example input:\n"
@@ -113,21 +109,33 @@ def parse_user_message(message):
         f"{cleaned_message}"
     )
 
-   
+
+def _valid_user_data(parsed_data):
+    return (
+        isinstance(parsed_data, dict)
+        and isinstance(parsed_data.get('preference'), str)
+        and isinstance(parsed_data.get('available_ingredients'), list)
+        and all(isinstance(ing, str) for ing in parsed_data['available_ingredients'])
+    )
+
+
+def _decode_user_response(response):
+    """
+    Decodes one generated response. Anything but a dict with a string
+    'preference' and a list of string 'available_ingredients' gives {}.
+    """
     try:
-        response = parse_user_message.parser(prompt, max_length=150, num_return_sequences=1)
-        print(response)
-        structured_data = response[0]['generated_text']
-        print(structured_data)
+        # A list input comes back flattened to one dict per prompt.
+        if isinstance(response, list):
+            response = response[0]
+        structured_data = response['generated_text']
         logger.debug(f"LLM Response for user message: {structured_data}")
 
-       
         parsed_data = json.loads(structured_data)
         logger.debug(f"Parsed User Data: {parsed_data}")
-        
-       
-        if 'preference' not in parsed_data or 'available_ingredients' not in parsed_data:
-            logger.error("Required keys missing in parsed data.")
+
+        if not _valid_user_data(parsed_data):
+            logger.error("Parsed data is missing 'preference' or 'available_ingredients', or they have the wrong type.")
             parsed_data = {}
     except json.JSONDecodeError as jde:
         logger.error(f"JSON decoding failed: {jde}")
@@ -138,6 +146,91 @@ def parse_user_message(message):
 
     return parsed_data
 
+
+def parse_user_message(message):
+    """
+    Uses an LLM to parse the user's free-form message into structured preferences and ingredients.
+    """
+    return parse_user_messages([message])[0]
+
+
+def parse_user_messages(messages, batch_size=16):
+    """
+    Parses many user messages with batched generation.
+    Returns one dict per message, in order; a message that could not be parsed gets {}.
+    """
+    if not messages:
+        return []
+
+    prompts = [_user_message_prompt(message) for message in messages]
+
+    def generate(deadline):
+        parser = get_pipeline('t5-small')
+        responses = generate_batches(parser, prompts, batch_size, deadline, max_length=150, num_return_sequences=1)
+        return [_decode_user_response(response) for response in responses]
+
+    try:
+        return admission.run(generate, fallback=lambda: [keyword_parse_user_message(m) for m in messages])
+    except InferenceOverloaded:
+        raise
+    except Exception as e:
+        logger.error(f"Error parsing user messages with LLM: {e}")
+        return [{} for _ in messages]
+
+
+TASTES = ['sweet', 'spicy', 'savory', 'savoury', 'sour', 'salty', 'bitter', 'umami', 'tangy', 'mild', 'hot']
+
+
+def keyword_parse_user_message(message):
+    """
+    Cheap fallback for parse_user_message when the model is overloaded: takes
+    the first known taste word and the list after "have"/"got"/"with".
+    """
+    cleaned = clean_user_message(message).lower()
+
+    preference = next((taste for taste in TASTES if re.search(rf'\b{taste}\b', cleaned)), '')
+    ingredients = []
+    match = re.search(r'\b(?:have|got|with|using)\b(.*)', cleaned)
+    if match:
+        ingredients = [ing.strip() for ing in re.split(r',|\band\b', match.group(1)) if ing.strip()]
+
+    if not preference or not ingredients:
+        return {}
+    return {'preference': preference, 'available_ingredients': ingredients}
+
+
+RECIPE_LABELS = {
+    'title': 'title',
+    'ingredients': 'ingredients',
+    'instructions': 'instructions',
+    'taste': 'taste',
+    'cuisine': 'cuisine_type',
+    'preptime': 'preparation_time',
+    'reviews': 'reviews',
+}
+
+
+def keyword_parse_recipe_text(text):
+    """
+    Cheap fallback for parse_unstructured_text when the model is overloaded:
+    reads "Title: ...", "Ingredients: ..." style labelled fields.
+    """
+    recipe_data = {}
+    sections = re.findall(r'^\s*(\w+)\s*:(.*?)(?=^\s*\w+\s*:|\Z)', text, flags=re.MULTILINE | re.DOTALL)
+    for label, value in sections:
+        field = RECIPE_LABELS.get(label.lower())
+        if field and field not in recipe_data:
+            recipe_data[field] = ' '.join(value.split())
+
+    for field in ('preparation_time', 'reviews'):
+        if field in recipe_data:
+            number = re.search(r'\d+', recipe_data[field])
+            recipe_data[field] = int(number.group()) if number else 0
+
+    if not recipe_data.get('title'):
+        return {}
+    return recipe_data
+
 def parse_recipe_image(image_path):
     """
     Extracts and parses recipe details from an image using OCR and LLM.
@@ -6,16 +6,27 @@ from rest_framework.response import Response
 from rest_framework import status
 from django.shortcuts import get_object_or_404
 from django.conf import settings
+from django.db.models import Q
+from django.http import JsonResponse, StreamingHttpResponse
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from asgiref.sync import sync_to_async
 
-from .models import Ingredient, Recipe
+from .models import Ingredient, Recipe, normalize_ingredients, normalize_label
 from .serializers import (
     IngredientSerializer,
+    IngredientBulkSerializer,
     RecipeSerializer,
-    ChatbotQuerySerializer
+    RecipeQuerySerializer,
+    ChatbotQuerySerializer,
+    ChatbotBatchSerializer
 )
-from .utils import parse_recipe_image, parse_unstructured_text, parse_user_message
-from transformers import pipeline
-import torch
+from .utils import parse_recipe_image, parse_unstructured_text, parse_user_message, parse_user_messages
+from .inference import get_pipeline, worker_report, InferenceOverloaded
+from .catalog import get_catalog
+from .inventory import apply_inventory_updates
+import base64
 import json
 import logging
 
@@ -28,41 +39,112 @@ class ChatbotService:
     """
     Service class to handle chatbot interactions using Hugging Face Transformers.
     """
-    def __init__(self):        
-        self.model = pipeline(
-            'text2text-generation',
-            model='google/flan-t5-small',
-            tokenizer='google/flan-t5-small',
-            device=0 if torch.cuda.is_available() else -1,
-            use_auth_token=LLM_API_KEY if LLM_API_KEY else None
-        )
+    @property
+    def model(self):
+        # Shared with the recipe parser; loaded once per process (or in the master when preloading).
+        return get_pipeline('flan-t5-small')
     
     def recommend_recipes(self, preference, available_ingredients):
         """
         Recommend recipes based on user preference and available ingredients.
         """        
-        recipes = Recipe.objects.filter(taste__icontains=preference)
-        suggestions = []
-                
+        return list(self.iter_recommendations(preference, available_ingredients))
+
+    def iter_recommendations(self, preference, available_ingredients):
+        """
+        Yields each recommended recipe as soon as it has been matched.
+        """
+        catalog = get_catalog()
+        if catalog is not None:
+            yield from catalog.recommend(preference, available_ingredients)
+            return
+
         available_ingredients = [ing.lower() for ing in available_ingredients]
-        
-        for recipe in recipes:
-            recipe_ingredients = [ing.strip().lower() for ing in recipe.ingredients.split(',')]            
-            if all(ing in available_ingredients for ing in recipe_ingredients):
-                suggestions.append({
-                    'title': recipe.title,
-                    'ingredients': recipe.ingredients.split(','),
-                    'instructions': recipe.instructions,
-                    'taste': recipe.taste,
-                    'cuisine_type': recipe.cuisine_type,
-                    'preparation_time': recipe.preparation_time
-                })
-        
-        return suggestions
+
+        for recipe in Recipe.objects.filter(taste__icontains=preference).iterator():
+            if self.matches(recipe, available_ingredients):
+                yield self.serialize_recipe(recipe)
+
+    def recommend_recipes_batch(self, queries):
+        """
+        Recommend recipes for many (preference, available_ingredients) pairs at once.
+        All candidates are fetched with a single query; returns one list per pair, in order.
+        """
+        catalog = get_catalog()
+        if catalog is not None:
+            return [list(catalog.recommend(*query)) for query in queries]
+
+        results = [[] for _ in queries]
+        queries = [
+            (preference.lower(), [ing.lower() for ing in available_ingredients])
+            for preference, available_ingredients in queries
+        ]
+
+        taste_filter = Q()
+        for preference in {preference for preference, _ in queries}:
+            taste_filter |= Q(taste__icontains=preference)
+
+        for recipe in Recipe.objects.filter(taste_filter).iterator():
+            taste = (recipe.taste or '').lower()
+            serialized = None
+            for index, (preference, available_ingredients) in enumerate(queries):
+                if preference in taste and self.matches(recipe, available_ingredients):
+                    if serialized is None:
+                        serialized = self.serialize_recipe(recipe)
+                    results[index].append(serialized)
+
+        return results
+
+    async def aiter_recommendations(self, preference, available_ingredients):
+        """
+        Async variant of iter_recommendations for the streaming endpoint.
+        """
+        # get_catalog() may check the change feed, which is a database query.
+        catalog = await sync_to_async(get_catalog)()
+        if catalog is not None:
+            for recommendation in catalog.recommend(preference, available_ingredients):
+                yield recommendation
+            return
+
+        available_ingredients = [ing.lower() for ing in available_ingredients]
+
+        async for recipe in Recipe.objects.filter(taste__icontains=preference).aiterator():
+            if self.matches(recipe, available_ingredients):
+                yield self.serialize_recipe(recipe)
+
+    @staticmethod
+    def matches(recipe, available_ingredients):
+        recipe_ingredients = normalize_ingredients(recipe.ingredients)
+        return all(ing in available_ingredients for ing in recipe_ingredients)
+
+    @staticmethod
+    def serialize_recipe(recipe):
+        return {
+            'title': recipe.title,
+            'ingredients': recipe.ingredients.split(','),
+            'instructions': recipe.instructions,
+            'taste': recipe.taste,
+            'cuisine_type': recipe.cuisine_type,
+            'preparation_time': recipe.preparation_time
+        }
 
 chatbot_service = ChatbotService()
 
 
+class InferenceAdmissionMixin:
+    """
+    Turns inference calls shed by the admission controller into 503 responses.
+    """
+    def handle_exception(self, exc):
+        if isinstance(exc, InferenceOverloaded):
+            return Response(
+                {'error': 'The model is overloaded, please retry shortly.'},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE,
+                headers={'Retry-After': '1'}
+            )
+        return super().handle_exception(exc)
+
+
 class IngredientListCreateView(APIView):
     """
     GET /ingredients/ - List all ingredients
@@ -109,7 +191,27 @@ class IngredientDetailView(APIView):
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
-class RecipeListCreateView(APIView):
+class IngredientBulkView(APIView):
+    """
+    POST /ingredients/bulk/ - Create or update many ingredients in one transaction
+    {
+        "mode": "set",            # or "increment" to add the quantities to the stock
+        "items": [
+            {"name": "sugar", "quantity": 300, "unit": "grams"},
+            {"name": "eggs", "quantity": 12}
+        ]
+    }
+    Returns only what changed: {"created": {...}, "updated": {...}, "unchanged": <count>}
+    """
+    def post(self, request):
+        serializer = IngredientBulkSerializer(data=request.data)
+        if serializer.is_valid():
+            diff = apply_inventory_updates(serializer.validated_data['items'], serializer.validated_data['mode'])
+            return Response(diff, status=status.HTTP_200_OK)
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+
+class RecipeListCreateView(InferenceAdmissionMixin, APIView):
     """
     GET /recipes/ - List all recipes
     POST /recipes/ - Create a new recipe (supports JSON and image uploads)
@@ -177,6 +279,59 @@ class RecipeListCreateView(APIView):
                 return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+class RecipeQueryView(APIView):
+    """
+    GET /recipes/query/?taste=spicy&cuisine_type=italian&max_preparation_time=30&order=reviews
+    Optional: ingredients=a,b (must use all), exclude_ingredients=c,d, limit (default 20, max 100),
+    cursor (the next_cursor of the previous page).
+
+    taste and cuisine_type match exactly (both are stored lowercased) so they can use the composite indexes.
+    Results are ordered by reviews or popularity, highest first, and paginated by keyset:
+    {"results": [...], "next_cursor": "..." or null}
+    """
+    def get(self, request):
+        serializer = RecipeQuerySerializer(data=request.query_params)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        params = serializer.validated_data
+        order = params['order']
+
+        recipes = Recipe.objects.all()
+        if params.get('taste'):
+            recipes = recipes.filter(taste=normalize_label(params['taste']))
+        if params.get('cuisine_type'):
+            recipes = recipes.filter(cuisine_type=normalize_label(params['cuisine_type']))
+        if 'max_preparation_time' in params:
+            recipes = recipes.filter(preparation_time__lte=params['max_preparation_time'])
+        for name in params.get('ingredients', []):
+            # One join per required ingredient, each through the (name, recipe) index.
+            recipes = recipes.filter(ingredient_links__name=name)
+        if params.get('exclude_ingredients'):
+            recipes = recipes.exclude(ingredient_links__name__in=params['exclude_ingredients'])
+
+        if 'cursor' in params:
+            sort_value, pk = params['cursor']
+            recipes = recipes.filter(
+                Q(**{f'{order}__lt': sort_value}) | Q(**{order: sort_value, 'id__lt': pk})
+            )
+
+        limit = params['limit']
+        page = list(recipes.order_by(f'-{order}', '-id')[:limit + 1])
+
+        next_cursor = None
+        if len(page) > limit:
+            page = page[:limit]
+            last = page[-1]
+            next_cursor = base64.urlsafe_b64encode(
+                json.dumps([getattr(last, order), last.pk]).encode()
+            ).decode()
+
+        return Response(
+            {'results': RecipeSerializer(page, many=True).data, 'next_cursor': next_cursor},
+            status=status.HTTP_200_OK
+        )
+
+
 class RecipeDetailView(APIView):
     """
     GET /recipes/<id>/ - Retrieve a specific recipe
@@ -205,7 +360,7 @@ class RecipeDetailView(APIView):
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
-class ChatbotView(APIView):
+class ChatbotView(InferenceAdmissionMixin, APIView):
     """
     POST /chatbot/
     {
@@ -236,4 +391,125 @@ class ChatbotView(APIView):
                 else:
                     return Response({'message': 'No matching recipes found.'}, status=status.HTTP_404_NOT_FOUND)
         
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
\ No newline at end of file
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+
+class ChatbotBatchView(InferenceAdmissionMixin, APIView):
+    """
+    POST /chatbot/batch/
+    {
+        "messages": [
+            "I want something sweet today and I have flour, sugar, eggs, butter.",
+            "Something spicy, I have chicken, onion, garlic."
+        ]
+    }
+    Returns one entry per message, in order:
+    {"index": 0, "recommendations": [...]} or {"index": 1, "error": "..."}
+    """
+    def post(self, request):
+        serializer = ChatbotBatchSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        messages = serializer.validated_data['messages']
+        parsed_messages = parse_user_messages(messages, batch_size=settings.CHATBOT_BATCH_SIZE)
+
+        results = [{'index': index} for index in range(len(messages))]
+        queries, query_indexes = [], []
+        for index, parsed_data in enumerate(parsed_messages):
+            preference = parsed_data.get('preference', '')
+            available_ingredients = parsed_data.get('available_ingredients', [])
+            if not preference or not available_ingredients:
+                results[index]['error'] = 'Could not extract preference or available ingredients from the message.'
+                continue
+            queries.append((preference, available_ingredients))
+            query_indexes.append(index)
+
+        if queries:
+            for index, recommendations in zip(query_indexes, chatbot_service.recommend_recipes_batch(queries)):
+                results[index]['recommendations'] = recommendations
+
+        return Response({'results': results}, status=status.HTTP_200_OK)
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class ChatbotStreamView(View):
+    """
+    POST /chatbot/stream/
+    Same body as /chatbot/. Streams the result as it is produced:
+
+        event: parsed           {"preference": ..., "available_ingredients": [...]}
+        event: recommendation   one per matching recipe, as soon as it is matched
+        event: done             {"count": <number of recommendations>}
+        event: error            {"error": ...} (ends the stream)
+
+    Sent as server-sent events, or as NDJSON ({"event": ..., "data": ...} per line)
+    when the client sends "Accept: application/x-ndjson". Serve through the ASGI
+    app (server/asgi.py); under WSGI the stream is buffered until complete.
+    """
+    async def post(self, request):
+        try:
+            data = json.loads(request.body or b'{}')
+        except json.JSONDecodeError:
+            return JsonResponse({'error': 'Request body must be valid JSON.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        serializer = ChatbotQuerySerializer(data=data)
+        if not serializer.is_valid():
+            return JsonResponse(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        if 'application/x-ndjson' in request.headers.get('Accept', ''):
+            encode, content_type = self.encode_ndjson, 'application/x-ndjson'
+        else:
+            encode, content_type = self.encode_sse, 'text/event-stream'
+
+        response = StreamingHttpResponse(
+            self.stream(serializer.validated_data, encode),
+            content_type=content_type
+        )
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+    async def stream(self, validated_data, encode):
+        message = validated_data.get('message', '')
+        if message:
+            # Generation is blocking; run it off the event loop.
+            try:
+                parsed_data = await sync_to_async(parse_user_message, thread_sensitive=False)(message)
+            except InferenceOverloaded:
+                yield encode('error', {'error': 'The model is overloaded, please retry shortly.'})
+                return
+            preference = parsed_data.get('preference', '')
+            available_ingredients = parsed_data.get('available_ingredients', [])
+        else:
+            preference = validated_data.get('preference', '')
+            available_ingredients = validated_data.get('available_ingredients', [])
+
+        if not preference or not available_ingredients:
+            yield encode('error', {'error': 'Could not extract preference or available ingredients from the message.'})
+            return
+
+        yield encode('parsed', {'preference': preference, 'available_ingredients': available_ingredients})
+
+        count = 0
+        async for recommendation in chatbot_service.aiter_recommendations(preference, available_ingredients):
+            count += 1
+            yield encode('recommendation', recommendation)
+
+        yield encode('done', {'count': count})
+
+    @staticmethod
+    def encode_sse(event, data):
+        return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+    @staticmethod
+    def encode_ndjson(event, data):
+        return json.dumps({'event': event, 'data': data}) + "\n"
+
+
+class ModelStatusView(APIView):
+    """
+    GET /models/status/ - Memory and CPU contention report for the worker serving the request
+    """
+    def get(self, request):
+        return Response(worker_report(), status=status.HTTP_200_OK)
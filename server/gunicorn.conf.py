@@ -0,0 +1,78 @@
+# gunicorn.conf.py
+#
+# Pre-fork serving with the models loaded once in the master:
+#
+#   gunicorn server.wsgi            (WSGI)
+#   gunicorn server.asgi -k uvicorn.workers.UvicornWorker   (ASGI)
+#
+# The workers share the preloaded weights copy-on-write, and each one gets
+# its share of the cores for torch's intra-op threads. The master keeps the
+# recipe catalog snapshot current with the change feed.
+#
+# WSGI workers are threaded: admission control (chatbot_app/inference.py)
+# limits concurrent generations per process, so a worker must take more
+# requests at once than it lets generate, or nothing is ever queued or shed.
+# Under the ASGI worker Django runs the DRF views on one thread per process,
+# so only the streaming endpoint gets concurrent inference there.
+
+import os
+import sys
+import subprocess
+import threading
+import time
+import logging
+
+workers = int(os.getenv('WEB_CONCURRENCY', '2'))
+os.environ['WEB_CONCURRENCY'] = str(workers)
+os.environ.setdefault('MODEL_PRELOAD', '1')
+
+# Enough threads for the generating calls, the admission queue behind them
+# and a few requests that don't need the model (same env vars as settings.py).
+worker_class = 'gthread'
+threads = int(os.getenv('GUNICORN_THREADS', '0')) or (
+    int(os.getenv('INFERENCE_MAX_CONCURRENCY', '2')) + int(os.getenv('INFERENCE_MAX_QUEUE', '16')) + 4
+)
+
+# Import the app (and so load the models) in the master before forking.
+preload_app = True
+
+logger = logging.getLogger('gunicorn.error')
+
+
+def _rebuild_recipe_catalog(interval):
+    # Run as a subprocess so the master never holds a database connection
+    # that forked workers would inherit.
+    from django.conf import settings
+
+    manage = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'manage.py')
+    env = {**os.environ, 'MODEL_PRELOAD': '0'}
+    while True:
+        time.sleep(interval)
+        if not os.path.exists(settings.RECIPE_CATALOG_PATH):
+            continue
+        result = subprocess.run(
+            [sys.executable, manage, 'build_recipe_catalog', '--if-changed'],
+            capture_output=True, text=True, env=env
+        )
+        if result.returncode != 0:
+            logger.error(f"Recipe catalog rebuild failed: {result.stderr.strip()}")
+
+
+def when_ready(server):
+    from django.conf import settings
+    interval = settings.RECIPE_CATALOG_REBUILD_INTERVAL
+    if interval > 0:
+        threading.Thread(target=_rebuild_recipe_catalog, args=(interval,), daemon=True).start()
+
+
+def post_fork(server, worker):
+    from chatbot_app.inference import configure_worker_threads
+    configure_worker_threads(workers)
+
+
+def post_worker_init(worker):
+    from chatbot_app.inference import warm_up, worker_report
+    from chatbot_app.catalog import get_catalog
+    warm_up()
+    get_catalog()
+    logger.info(f"Worker ready: {worker_report()}")
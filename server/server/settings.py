@@ -132,3 +132,40 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+
+# Model serving
+# MODEL_PRELOAD loads the models when the app is set up, i.e. once in the
+# master before a pre-forking server (see gunicorn.conf.py) starts workers.
+MODEL_PRELOAD = os.getenv('MODEL_PRELOAD', '0') == '1'
+MODEL_WORKERS = int(os.getenv('WEB_CONCURRENCY', '1'))
+MODEL_THREADS_PER_WORKER = int(os.getenv('MODEL_THREADS_PER_WORKER', '0')) or None
+
+# Admission control around inference (per process): concurrent generations,
+# calls allowed to wait before new ones are rejected with 503, seconds to wait
+# for a slot, per-call generation deadline, and the queue latency above which
+# messages are parsed with the keyword fallback instead of the model.
+INFERENCE_MAX_CONCURRENCY = int(os.getenv('INFERENCE_MAX_CONCURRENCY', '2'))
+INFERENCE_MAX_QUEUE = int(os.getenv('INFERENCE_MAX_QUEUE', '16'))
+INFERENCE_QUEUE_TIMEOUT = float(os.getenv('INFERENCE_QUEUE_TIMEOUT', '2'))
+INFERENCE_DEADLINE = float(os.getenv('INFERENCE_DEADLINE', '10'))
+INFERENCE_DEGRADE_LATENCY = float(os.getenv('INFERENCE_DEGRADE_LATENCY', '1'))
+
+# Batch chatbot endpoint: messages accepted per request, and generation batch size
+CHATBOT_BATCH_MAX_MESSAGES = int(os.getenv('CHATBOT_BATCH_MAX_MESSAGES', '256'))
+CHATBOT_BATCH_SIZE = int(os.getenv('CHATBOT_BATCH_SIZE', '16'))
+
+# Recipe catalog snapshot (built by `manage.py build_recipe_catalog`). When the
+# file exists and is current with the change feed, recommendations are served
+# from it instead of the database; workers check for a rebuilt file and for
+# newer recipe changes every RECIPE_CATALOG_CHECK_INTERVAL seconds.
+RECIPE_CATALOG_PATH = os.getenv('RECIPE_CATALOG_PATH', os.path.join(BASE_DIR, 'recipe_catalog.bin'))
+RECIPE_CATALOG_CHECK_INTERVAL = float(os.getenv('RECIPE_CATALOG_CHECK_INTERVAL', '5'))
+# Under gunicorn, seconds between `build_recipe_catalog --if-changed` runs (0 disables).
+RECIPE_CATALOG_REBUILD_INTERVAL = float(os.getenv('RECIPE_CATALOG_REBUILD_INTERVAL', '30'))
+
+# Change feed: seconds after which a gap in the entry ids is taken to be a
+# rolled-back write rather than one not yet committed (see changefeed.py).
+CHANGEFEED_SETTLE_SECONDS = float(os.getenv('CHANGEFEED_SETTLE_SECONDS', '60'))
+
+# Bulk ingredient endpoint: items accepted per request
+INGREDIENT_BULK_MAX_ITEMS = int(os.getenv('INGREDIENT_BULK_MAX_ITEMS', '10000'))